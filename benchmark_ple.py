@@ -0,0 +1,232 @@
+"""Benchmark de scriptPLE con libros DIARIO sintéticos.
+
+Genera libros con la misma estructura que los reales (hoja 5 Libro Diario,
+hoja 6 Plan de Cuentas y los encabezados que busca ``buscar_columna``),
+mide cada etapa del procesamiento y guarda un reporte JSON comparable
+entre versiones.
+
+    python benchmark_ple.py --filas 10000 100000 --cuentas 3000 --salida bench.json
+"""
+from pathlib import Path
+import argparse
+import json
+import logging
+import platform
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import scriptPLE as ple
+
+# Límite de filas de una hoja xlsx (incluye la fila de encabezados)
+MAX_FILAS_EXCEL = 1_048_575
+
+MESES_NOMBRE = {codigo: nombre for nombre, codigo in reversed(list(ple.MESES.items()))}
+
+TIPOS_JOURNAL = np.array(["VTA", "CMP", "CAJ", "DIA", "APE"], dtype=object)
+MONEDAS = np.array(["PEN", "PEN", "PEN", "USD", "Soles"], dtype=object)
+
+# Estilos de Transaction Reference que reconoce parse_doc (y algunos que no)
+PATRONES_REFERENCIA = {
+    "guion":    lambda i: f"F{i % 999 + 1:03d}-{i:06d}",
+    "barra":    lambda i: f"B{i % 99 + 1:03d}/{i}",
+    "compacto": lambda i: f"F{i % 999 + 1:03d}{i:08d}",
+    "ticket":   lambda i: f"T{i % 99 + 1:03d}-{i}",
+    "digitos":  lambda i: f"{i:010d}",
+    "apertura": lambda i: f"APERTURA {i}",
+    "libre":    lambda i: f"REF LIBRE {i}",
+}
+
+ETAPAS = ["carga", "plan", "lineas", "resumen", "escritura"]
+
+
+# ------------------------------------------------------------------
+# Generación de datos sintéticos
+# ------------------------------------------------------------------
+
+def generar_datos(filas: int, cuentas: int = 3000, referencias: int = 20000,
+                  patrones: list[str] | None = None, anio: int = 2020, mes: str = "02",
+                  columnas_extra: int = 20, semilla: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Devuelve (diario_df, pc_df) sintéticos con *filas* líneas y *cuentas* códigos distintos."""
+    rng = np.random.default_rng(semilla)
+    patrones = patrones or list(PATRONES_REFERENCIA)
+
+    # ---------------- Plan de Cuentas (con ~10 % de códigos repetidos) ----------------
+    codigos = rng.choice(np.arange(100000, 1000000), size=cuentas, replace=False)
+    repetidos = rng.choice(codigos, size=max(cuentas // 10, 1))
+    plan_codigos = np.concatenate([codigos, repetidos])
+    nombres = [f"CUENTA {c} {'DESCRIPCION LARGA' if i < cuentas else 'CORTA'}"
+               for i, c in enumerate(plan_codigos)]
+    pc_df = pd.DataFrame({
+        "Empresa": "01",
+        "Cuenta Local": plan_codigos,
+        "Cuenta Peruana": plan_codigos,
+        "Nombre de Cuenta Contable": nombres,
+    })
+
+    # ---------------- Libro Diario ----------------
+    # 94 % cuentas del plan, 5 % sub-cuentas desconocidas, 1 % vacías
+    cuenta_diario = rng.choice(codigos, size=filas).astype(object)
+    sorteo = rng.random(filas)
+    desconocidas = sorteo < 0.05
+    cuenta_diario[desconocidas] = cuenta_diario[desconocidas] * 100 + 1
+    cuenta_diario[(sorteo >= 0.05) & (sorteo < 0.06)] = np.nan
+
+    # fechas: mayoría del mes, parte de meses anteriores (estado 8) y algunas vacías
+    inicio = pd.Timestamp(anio, int(mes), 1)
+    dias = rng.integers(0, ple.ultimo_dia_mes(anio, int(mes)), size=filas)
+    fechas = pd.Series(inicio + pd.to_timedelta(dias, unit="D"))
+    anteriores = rng.random(filas) < 0.1
+    fechas[anteriores] = fechas[anteriores] - pd.to_timedelta(rng.integers(31, 400, size=anteriores.sum()), unit="D")
+    fechas[rng.random(filas) < 0.01] = pd.NaT
+
+    refs_unicas = np.array([PATRONES_REFERENCIA[patrones[i % len(patrones)]](i) for i in range(referencias)],
+                           dtype=object)
+
+    montos = np.round(rng.normal(0, 5000, size=filas), 2)
+    diario = {
+        "Cuenta Peruana": cuenta_diario,
+        "Transaction Date": fechas.to_numpy(),
+        "Description": [f"LINEA {i}" for i in range(filas)],
+        "Debit/Credit": np.where(montos >= 0, "D", "C"),
+        "Base Amount": montos,
+        "Transaction Amount": montos,
+        "Journal Number": rng.integers(1, max(filas // 8, 2), size=filas),
+        "Journal Type": rng.choice(TIPOS_JOURNAL, size=filas),
+        "Transaction Currency Code": rng.choice(MONEDAS, size=filas),
+        "Transaction Reference": rng.choice(refs_unicas, size=filas),
+    }
+    for i in range(columnas_extra):
+        diario[f"Extra {i}"] = rng.integers(0, 1000, size=filas)
+    diario_df = pd.DataFrame(diario)
+    # glosa en columna "Description" repetida (pandas la lee como "Description.1")
+    diario_df.insert(3, "Description.1", [f"GLOSA {i % 5000}" for i in range(filas)])
+    return diario_df, pc_df
+
+
+def escribir_libro(ruta: Path, diario_df: pd.DataFrame, pc_df: pd.DataFrame) -> None:
+    """Escribe el libro xlsx con el Diario en la hoja 5 y el Plan de Cuentas en la hoja 6."""
+    diario_xlsx = diario_df.rename(columns={"Description.1": "Description"})
+    with pd.ExcelWriter(ruta, engine="openpyxl") as writer:
+        for i in range(ple.HOJA_DIARIO):
+            pd.DataFrame({"Hoja": [i + 1]}).to_excel(writer, sheet_name=f"Hoja{i + 1}", index=False)
+        diario_xlsx.to_excel(writer, sheet_name="Libro Diario", index=False)
+        pc_df.to_excel(writer, sheet_name="Plan de Cuentas", index=False)
+
+
+# ------------------------------------------------------------------
+# Medición por etapa
+# ------------------------------------------------------------------
+
+def _cargar(ruta: Path) -> tuple[pd.DataFrame, pd.DataFrame, dict, str, str]:
+    xls = pd.ExcelFile(ruta)
+    diario_encab = ple.leer_encabezados(xls, ple.HOJA_DIARIO)
+    pc_encab = ple.leer_encabezados(xls, ple.HOJA_PLAN)
+    col_cuenta_pc, col_nombre_cuenta = ple.resolver_columnas_plan(pc_encab, usar_cache=False)
+    columnas = ple.resolver_columnas_diario(diario_encab, usar_cache=False)
+    diario_df = ple.leer_columnas(xls, ple.HOJA_DIARIO, diario_encab,
+                                  {columnas[k]: ple.TIPOS_DIARIO.get(k) for k in columnas if columnas[k]})
+    pc_df = ple.leer_columnas(xls, ple.HOJA_PLAN, pc_encab, {col_cuenta_pc: object, col_nombre_cuenta: None})
+    return diario_df, pc_df, columnas, col_cuenta_pc, col_nombre_cuenta
+
+
+def medir(filas: int, directorio: Path, motor: str = "vectorizado", con_excel: bool = True,
+          **opciones) -> dict:
+    """Genera un libro de *filas* líneas y devuelve los tiempos (s) de cada etapa."""
+    anio, mes = 2020, "02"
+    diario_df, pc_df = generar_datos(filas, anio=anio, mes=mes, **opciones)
+    tiempos: dict[str, float | None] = {}
+
+    con_excel = con_excel and filas <= MAX_FILAS_EXCEL
+    if con_excel:
+        ruta = directorio / f"DIARIO, {MESES_NOMBRE[mes]} {anio}_2.xlsx"
+        escribir_libro(ruta, diario_df, pc_df)
+        t0 = time.perf_counter()
+        diario_df, pc_df, columnas, col_cuenta_pc, col_nombre_cuenta = _cargar(ruta)
+        tiempos["carga"] = time.perf_counter() - t0
+    else:
+        # sin xlsx (o más filas de las que admite una hoja): se parte de los DataFrames
+        columnas = ple.resolver_columnas_diario(diario_df, usar_cache=False)
+        col_cuenta_pc, col_nombre_cuenta = ple.resolver_columnas_plan(pc_df, usar_cache=False)
+        tiempos["carga"] = None
+
+    t0 = time.perf_counter()
+    pc_df = ple.preparar_plan(pc_df, col_cuenta_pc, col_nombre_cuenta)
+    cuentas_validas = set(pc_df["codigo_cuenta"].values)
+    tiempos["plan"] = time.perf_counter() - t0
+
+    if motor == "filas":
+        t0 = time.perf_counter()
+        lineas, resumen = ple.MOTORES_DIARIO["filas"](diario_df, columnas, cuentas_validas, anio, mes)
+        tiempos["lineas"] = time.perf_counter() - t0
+        tiempos["resumen"] = None  # el motor de referencia lo acumula dentro del bucle
+    else:
+        t0 = time.perf_counter()
+        campos = ple.calcular_campos_diario(diario_df, columnas, cuentas_validas, anio, mes)
+        lineas = ple.armar_lineas_diario(campos)
+        tiempos["lineas"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        resumen = ple.resumen_por_estado(campos["estado"], campos["debe"].to_numpy(), campos["haber"].to_numpy())
+        tiempos["resumen"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    periodo_plan = f"{anio}{mes}{ple.ultimo_dia_mes(anio, int(mes)):02d}"
+    ple.escribir_txt(directorio / "diario.txt", lineas)
+    ple.escribir_txt(directorio / "plan.txt", ple.generar_lineas_plan(pc_df, col_nombre_cuenta, periodo_plan))
+    tiempos["escritura"] = time.perf_counter() - t0
+
+    return {
+        "filas": filas,
+        "lineas_diario": resumen["lineas"],
+        "cuentas_plan": len(pc_df),
+        "excel": con_excel,
+        "etapas": tiempos,
+        "total": sum(t for t in tiempos.values() if t is not None),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark por etapas de scriptPLE con datos sintéticos.")
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000],
+                        help="tamaños del Libro Diario a medir (10k – 5M)")
+    parser.add_argument("--cuentas", type=int, default=3000, help="códigos de cuenta distintos")
+    parser.add_argument("--referencias", type=int, default=20000, help="Transaction Reference distintas")
+    parser.add_argument("--patrones", nargs="+", choices=list(PATRONES_REFERENCIA),
+                        help="estilos de referencia a usar (por defecto todos)")
+    parser.add_argument("--columnas-extra", type=int, default=20, help="columnas no usadas en el Diario")
+    parser.add_argument("--motor", choices=list(ple.MOTORES_DIARIO), default=ple.MOTOR_DIARIO)
+    parser.add_argument("--sin-excel", action="store_true",
+                        help="no escribir/leer xlsx: mide desde los DataFrames en memoria")
+    parser.add_argument("--salida", type=Path, default=Path("bench_report.json"))
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    resultados = []
+    for filas in args.filas:
+        with tempfile.TemporaryDirectory() as tmp:
+            r = medir(filas, Path(tmp), motor=args.motor, con_excel=not args.sin_excel,
+                      cuentas=args.cuentas, referencias=args.referencias,
+                      patrones=args.patrones, columnas_extra=args.columnas_extra)
+        resultados.append(r)
+        detalle = "  ".join(f"{e}={r['etapas'][e]:.3f}s" for e in ETAPAS if r["etapas"][e] is not None)
+        print(f"{filas:>9} filas  {detalle}  total={r['total']:.3f}s")
+
+    reporte = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "motor": args.motor,
+        "parametros": {"cuentas": args.cuentas, "referencias": args.referencias,
+                       "patrones": args.patrones or list(PATRONES_REFERENCIA),
+                       "columnas_extra": args.columnas_extra},
+        "resultados": resultados,
+    }
+    args.salida.write_text(json.dumps(reporte, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Reporte → {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Entrada de línea de comandos de scriptPLE, sin pandas ni numpy.
+
+Reúne la configuración general, la búsqueda de entradas y el manifiesto, que es
+lo que necesitan ``--help``, ``--listar`` y ``--estado``; ``scriptPLE`` (y con él
+pandas) se importa recién cuando hay que leer o generar libros.
+
+    python ple_cli.py --estado
+"""
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+
+# ------------------------------------------------------------------
+# Configuración general
+# ------------------------------------------------------------------
+FORMATO_LOG = "%(levelname)s: %(message)s"
+
+RUC = "20470526379"  # ← actualízalo si cambia tu número de RUC
+ANIO_TRABAJO = 2020  # año de los libros (fijo; no se deduce del nombre)
+INPUT_DIR = Path(".")              # carpeta donde pones los Excel
+OUTPUT_DIR = INPUT_DIR / "output_txt"  # carpeta destino de los .TXT PLE (se crea al escribir)
+
+MESES = {
+    "ENERO": "01", "FEBRERO": "02", "MARZO": "03", "ABRIL": "04", "MAYO": "05",
+    "JUNIO": "06", "JULIO": "07", "AGOSTO": "08", "SETIEMBRE": "09", "SEPTIEMBRE": "09",
+    "OCTUBRE": "10", "NOVIEMBRE": "11", "DICIEMBRE": "12"
+}
+
+HOJA_DIARIO = 4  # Hoja 5: Libro Diario
+HOJA_PLAN   = 5  # Hoja 6: Plan de Cuentas
+
+# Entradas exportadas por el ERP como tablas: un directorio por mes con
+# diario.<ext> y plan.<ext>, o el par "DIARIO, <MES> ….<ext>" + "PLAN, <MES> ….<ext>".
+EXTENSIONES_TABLA = (".parquet", ".csv")
+TABLAS_ENTRADA = {HOJA_DIARIO: "diario", HOJA_PLAN: "plan"}
+
+# Orden de las líneas 5.3: "codigo" (ordenado por código, como siempre) u
+# "original" (orden de aparición en la hoja, sin ordenar)
+ORDEN_PLAN = "codigo"
+
+# Filas de ejemplo que se muestran por aviso (con detalle, todas)
+MUESTRAS_AVISO = 5
+
+# ------------------------------------------------------------------
+# Entradas y rutas de salida
+# ------------------------------------------------------------------
+
+def extraer_mes_archivo(nombre: str) -> str | None:
+    """Devuelve el número de mes (01‑12) detectado en el nombre del archivo."""
+    for mes, codigo in MESES.items():
+        if mes in nombre.upper():
+            return codigo
+    return None
+
+
+def tablas_entrada(ruta: Path) -> dict[int, Path] | None:
+    """Tablas CSV/Parquet de la entrada *ruta* como {hoja: archivo}; None si es un libro Excel.
+
+    El plan puede faltar (p. ej. cuando se usa un Plan compartido con --plan).
+    """
+    if ruta.is_dir():
+        candidatos = {hoja: [ruta / f"{nombre}{ext}" for ext in EXTENSIONES_TABLA]
+                      for hoja, nombre in TABLAS_ENTRADA.items()}
+    elif ruta.suffix.lower() in EXTENSIONES_TABLA:
+        nombre_plan = ruta.stem.replace("DIARIO", "PLAN", 1)
+        candidatos = {HOJA_DIARIO: [ruta],
+                      HOJA_PLAN: [ruta.with_name(f"{nombre_plan}{ext}") for ext in EXTENSIONES_TABLA]}
+    else:
+        return None
+    tablas = {}
+    for hoja, rutas in candidatos.items():
+        existentes = [r for r in rutas if r.is_file()]
+        if existentes:
+            tablas[hoja] = existentes[0]
+    return tablas
+
+
+def hash_archivo(ruta: Path) -> str:
+    """SHA‑256 del contenido de *ruta* (lectura por bloques)."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while bloque := f.read(1 << 20):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def hash_entrada(ruta: Path) -> str:
+    """Huella del contenido de la entrada (el libro, o todas sus tablas)."""
+    tablas = tablas_entrada(ruta)
+    if tablas is None:
+        return hash_archivo(ruta)
+    h = hashlib.sha256()
+    for hoja, tabla in sorted(tablas.items()):
+        h.update(f"{hoja}{tabla.suffix.lower()}:{hash_archivo(tabla)}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def rutas_salida(anio: int, mes: str) -> tuple[Path, Path]:
+    """Rutas de los TXT 5.1 (Diario) y 5.3 (Plan de Cuentas) del periodo."""
+    return (OUTPUT_DIR / f"LE{RUC}{anio}{mes}00050100001111.txt",
+            OUTPUT_DIR / f"LE{RUC}{anio}{mes}00050300001111.txt")
+
+
+# ------------------------------------------------------------------
+# Manifiesto de generación (modo incremental)
+# ------------------------------------------------------------------
+
+# Se incrementa cuando cambia el contenido que se genera, para forzar la regeneración.
+VERSION_GENERADOR = "3"
+ARCHIVO_MANIFIESTO = "manifiesto_ple.json"
+
+
+def leer_manifiesto() -> dict[str, dict]:
+    """Devuelve {nombre de salida: entrada} del manifiesto en OUTPUT_DIR (vacío si no existe)."""
+    try:
+        datos = json.loads((OUTPUT_DIR / ARCHIVO_MANIFIESTO).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Manifiesto ilegible: {e} – se regenera todo.")
+        return {}
+    return datos.get("salidas", {})
+
+
+def variante_salida(orden_plan: str = ORDEN_PLAN, subir_a_padre: bool = False) -> str:
+    """Opciones que cambian el contenido generado, tal como se registran en el manifiesto."""
+    return f"orden_plan={orden_plan};subir_a_padre={int(subir_a_padre)}"
+
+
+def entrada_manifiesto(archivo: Path, huella: str, anio: int, salida: Path,
+                       huella_plan: str | None = None, variante: str = "") -> dict:
+    return {
+        "entrada": archivo.name,
+        "hash_entrada": huella,
+        "hash_plan": huella_plan,
+        "variante": variante,
+        "ruc": RUC,
+        "anio": anio,
+        "version": VERSION_GENERADOR,
+        "bytes": salida.stat().st_size,
+    }
+
+
+def salidas_vigentes(huella: str, anio: int, salidas: list[Path], huella_plan: str | None = None,
+                     variante: str = "") -> bool:
+    """True si todas las *salidas* existen y fueron generadas desde la misma entrada y versión.
+
+    *huella_plan* identifica el Plan compartido (--plan) usado, si lo hay, y *variante*
+    las opciones de generación (``variante_salida``).
+    """
+    manifiesto = leer_manifiesto()
+    for salida in salidas:
+        entrada = manifiesto.get(salida.name)
+        if (
+            entrada is None
+            or entrada.get("hash_entrada") != huella
+            or entrada.get("hash_plan") != huella_plan
+            or entrada.get("variante", "") != variante
+            or entrada.get("ruc") != RUC
+            or entrada.get("anio") != anio
+            or entrada.get("version") != VERSION_GENERADOR
+            or not salida.exists()
+            or salida.stat().st_size != entrada.get("bytes")
+        ):
+            return False
+    return True
+
+
+def actualizar_manifiesto(resultados: list[tuple[Path, dict | None]]) -> None:
+    """Registra en el manifiesto las salidas generadas en esta corrida."""
+    nuevas = {
+        nombre: entrada
+        for _, resumen in resultados if resumen and resumen.get("manifiesto")
+        for nombre, entrada in resumen["manifiesto"].items()
+    }
+    if not nuevas:
+        return
+    manifiesto = leer_manifiesto()
+    manifiesto.update(nuevas)
+    ruta = OUTPUT_DIR / ARCHIVO_MANIFIESTO
+    temporal = ruta.with_name(f"{ruta.name}.tmp")
+    temporal.write_text(json.dumps({"salidas": dict(sorted(manifiesto.items()))}, indent=2, ensure_ascii=False),
+                        encoding="utf-8")
+    os.replace(temporal, ruta)
+
+
+# ------------------------------------------------------------------
+# Búsqueda de archivos y línea de comandos
+# ------------------------------------------------------------------
+
+def buscar_entradas(directorio: Path) -> list[Path]:
+    """Entradas mensuales de *directorio*: libros .xlsx, Diarios .csv/.parquet o directorios por mes."""
+    entradas = []
+    for extension in (".xlsx", *EXTENSIONES_TABLA):
+        entradas += directorio.glob(f"DIARIO,*2020_2{extension}")
+    return entradas + [ruta for ruta in directorio.glob("DIARIO,*2020_2") if ruta.is_dir()]
+
+
+def salidas_al_dia(archivo: Path, anual: bool = False, plan: dict | None = None, variante: str = "") -> bool:
+    """True si el manifiesto indica que las salidas de *archivo* están al día (sin leer la entrada)."""
+    meses = sorted(set(MESES.values())) if anual else [extraer_mes_archivo(archivo.stem)]
+    if None in meses:
+        return False
+    salidas = [ruta for mes in meses for ruta in rutas_salida(ANIO_TRABAJO, mes)]
+    return salidas_vigentes(hash_entrada(archivo), ANIO_TRABAJO, salidas,
+                            plan["huella"] if plan is not None else None, variante)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """CLI; devuelve el código de salida (0 si todas las entradas se procesaron bien)."""
+    parser = argparse.ArgumentParser(description="Genera los TXT PLE 5.1 / 5.3 desde los Excel DIARIO.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="archivos a procesar en paralelo (procesos); 1 = secuencial")
+    parser.add_argument("--secuencial", dest="pipeline", action="store_false",
+                        help="con un solo job, procesar un archivo tras otro sin solapar lectura, "
+                             "generación y escritura")
+    parser.add_argument("--no-cache", dest="usar_cache", action="store_false",
+                        help="no leer ni guardar la caché de hojas parseadas")
+    parser.add_argument("--forzar", dest="incremental", action="store_false",
+                        help="regenerar todo aunque el manifiesto indique que las salidas están al día")
+    parser.add_argument("--bloque-filas", dest="filas_por_bloque", type=int, metavar="N",
+                        help="generar el Libro Diario por bloques de N filas (memoria acotada)")
+    parser.add_argument("--memoria-max", dest="memoria_max_mb", type=float, metavar="MB",
+                        help="techo de memoria para la generación del Diario; estima el tamaño de bloque")
+    parser.add_argument("--orden-plan", choices=["codigo", "original"], default=ORDEN_PLAN,
+                        help="orden del Plan de Cuentas 5.3: por código u orden original de la hoja")
+    parser.add_argument("--subir-a-padre", dest="subir_a_padre", action="store_true",
+                        help="imputar las líneas con subcuentas que no están en el Plan a su cuenta "
+                             "padre más cercana en lugar de descartarlas")
+    parser.add_argument("--plan", type=Path, metavar="XLSX",
+                        help="libro cuyo Plan de Cuentas (hoja 6) se usa para todos los meses; "
+                             "se lee una sola vez")
+    parser.add_argument("--anual", type=Path, metavar="ENTRADA",
+                        help="procesar solo ENTRADA como Diario de todo el año y generar los 12 meses")
+    parser.add_argument("--detalle-avisos", dest="detalle_avisos", action="store_true",
+                        help="listar todas las filas afectadas en cada aviso (por defecto, "
+                             f"cantidad y {MUESTRAS_AVISO} filas de ejemplo)")
+    parser.add_argument("--metricas", type=Path, metavar="RUTA",
+                        help="guardar tiempos y contadores por etapa (JSON, o CSV si termina en .csv)")
+    parser.add_argument("--listar", action="store_true",
+                        help="solo mostrar las entradas que se procesarían")
+    parser.add_argument("--estado", action="store_true",
+                        help="solo indicar, según el manifiesto, qué entradas tienen las salidas al día")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format=FORMATO_LOG)
+
+    archivos = [args.anual] if args.anual else buscar_entradas(INPUT_DIR)
+    if not archivos:
+        logging.warning("No se encontraron entradas con patrón 'DIARIO,*2020_2' (.xlsx, .csv, .parquet o directorio)")
+        return 0
+    if args.listar:
+        for archivo in archivos:
+            logging.info(f"  {archivo.name}")
+        return 0
+
+    plan = None
+    if args.plan:
+        import scriptPLE  # pandas/numpy se cargan recién aquí
+        try:
+            plan = scriptPLE.cargar_plan(args.plan, args.orden_plan, args.usar_cache)
+        except Exception as e:
+            logging.error(f"No se pudo leer el Plan de Cuentas compartido {args.plan}: {e}")
+            return 1
+
+    if args.estado:
+        variante = variante_salida(args.orden_plan, args.subir_a_padre)
+        pendientes = 0
+        for archivo in archivos:
+            al_dia = salidas_al_dia(archivo, bool(args.anual), plan, variante)
+            pendientes += not al_dia
+            logging.info(f"  {'=    ' if al_dia else 'PEND '}  {archivo.name}")
+        logging.info(f"Estado: {len(archivos) - pendientes} al día, {pendientes} por generar")
+        return 0
+
+    import scriptPLE
+    resultados = scriptPLE.procesar_archivos(archivos, jobs=args.jobs, pipeline=args.pipeline,
+                                             anual=bool(args.anual), plan=plan, usar_cache=args.usar_cache,
+                                             incremental=args.incremental, filas_por_bloque=args.filas_por_bloque,
+                                             memoria_max_mb=args.memoria_max_mb, orden_plan=args.orden_plan,
+                                             subir_a_padre=args.subir_a_padre, detalle_avisos=args.detalle_avisos)
+    if args.metricas:
+        scriptPLE.guardar_metricas(args.metricas, resultados)
+
+    correctos = sum(resumen is not None for _, resumen in resultados)
+    sin_cambios = sum(bool(resumen and resumen.get("sin_cambios")) for _, resumen in resultados)
+    logging.info(f"Resumen: {len(resultados)} archivos, {correctos} correctos ({sin_cambios} sin cambios), "
+                 f"{len(resultados) - correctos} con error/omitidos")
+    for archivo, resumen in resultados:
+        estado = "ERROR" if resumen is None else ("=    " if resumen.get("sin_cambios") else "OK   ")
+        logging.info(f"  {estado}  {archivo.name}")
+    return 0 if correctos == len(resultados) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,41 +1,59 @@
 from pathlib import Path
-import pandas as pd
+import concurrent.futures
+import functools
+import logging.handlers
+import sys
 import re
 import logging
-from collections import defaultdict
+from collections import defaultdict, deque
+from collections.abc import Iterable, Iterator
+from itertools import islice
 import calendar  # para calcular último día del mes
+import csv
+import hashlib
+import hmac
+import json
+import os
+import pickle
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from decimal import ROUND_HALF_EVEN, Decimal
+
+import numpy as np
+import pandas as pd
+
+# La configuración general (RUC, año, carpetas), la búsqueda de entradas, el
+# manifiesto y la CLI están en ple_cli, que arranca sin importar pandas.
+from ple_cli import (
+    ANIO_TRABAJO, ARCHIVO_MANIFIESTO, EXTENSIONES_TABLA, FORMATO_LOG, HOJA_DIARIO, HOJA_PLAN,
+    INPUT_DIR, MESES, MUESTRAS_AVISO, ORDEN_PLAN, OUTPUT_DIR, RUC, TABLAS_ENTRADA, VERSION_GENERADOR,
+    actualizar_manifiesto, buscar_entradas, entrada_manifiesto, extraer_mes_archivo, hash_archivo,
+    hash_entrada, leer_manifiesto, main, rutas_salida, salidas_al_dia, salidas_vigentes, tablas_entrada,
+    variante_salida,
+)
 
 # ------------------------------------------------------------------
 # Configuración general
 # ------------------------------------------------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(levelname)s: %(message)s"
-)
+# Motor de generación del Libro Diario: "vectorizado" (por columnas) o
+# "filas" (bucle iterrows original, se mantiene como referencia para comparar)
+MOTOR_DIARIO = "vectorizado"
 
-RUC = "20470526379"  # ← actualízalo si cambia tu número de RUC
-INPUT_DIR = Path(".")              # carpeta donde pones los Excel
-OUTPUT_DIR = INPUT_DIR / "output_txt"  # carpeta destino de los .TXT PLE
-OUTPUT_DIR.mkdir(exist_ok=True)
-
-MESES = {
-    "ENERO": "01", "FEBRERO": "02", "MARZO": "03", "ABRIL": "04", "MAYO": "05",
-    "JUNIO": "06", "JULIO": "07", "AGOSTO": "08", "SETIEMBRE": "09", "SEPTIEMBRE": "09",
-    "OCTUBRE": "10", "NOVIEMBRE": "11", "DICIEMBRE": "12"
-}
+# Caché de hojas ya parseadas (evita decodificar el xlsx si no cambió). Está en la
+# carpeta de caché del usuario y no junto a las entradas (que suele ser compartida):
+# los .pkl se cargan con pickle, que puede ejecutar código, así que además solo se
+# leen los firmados con la clave de este usuario (ver ``_leer_pickle``).
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or os.environ.get("LOCALAPPDATA")
+                 or Path.home() / ".cache") / "scriptPLE"
+CACHE_MAX_BYTES = 2 * 1024 ** 3     # tamaño máximo; se eliminan las entradas menos usadas
 
 # ------------------------------------------------------------------
 # Utilidades genéricas
 # ------------------------------------------------------------------
 
-def extraer_mes_archivo(nombre: str) -> str | None:
-    """Devuelve el número de mes (01‑12) detectado en el nombre del archivo."""
-    for mes, codigo in MESES.items():
-        if mes in nombre.upper():
-            return codigo
-    return None
-
-
 def ultimo_dia_mes(anno: int, mes: int) -> int:
     """Devuelve el último día (28‑31) para *mes* y *anno*."""
     return calendar.monthrange(anno, mes)[1]
@@ -50,6 +68,23 @@ def normalizar_codigo(codigo) -> str:
     return str(codigo).strip().replace(" ", "").upper()
 
 
+def normalize_accounts(serie: pd.Series) -> pd.Series:
+    """Aplica ``normalizar_codigo`` a una columna normalizando solo los códigos distintos."""
+    codigos, unicos = pd.factorize(serie)
+    unicos = np.asarray(unicos, dtype=object)
+    normalizados = np.array([normalizar_codigo(u) for u in unicos] + [""], dtype=object)
+    # el código -1 (NaN/None) cae en la última posición → ""
+    resultado = normalizados[codigos]
+    # factorize une True con 1 y False con 0 (mismo hash): las filas de esos
+    # códigos se normalizan valor por valor para no perder "TRUE"/"FALSE"
+    ambiguos = np.array([isinstance(u, (bool, int, float, np.bool_, np.number)) and u in (0, 1)
+                         for u in unicos] + [False])
+    filas = ambiguos[codigos]
+    if filas.any():
+        resultado[filas] = serie[filas].map(normalizar_codigo).to_numpy(dtype=object)
+    return pd.Series(resultado, index=serie.index, dtype=object)
+
+
 def canon(col: str) -> str:
     """Normaliza nombres de columnas (minúsculas, 1 espacio entre palabras)."""
     return re.sub(r"\s+", " ", str(col).lower()).strip()
@@ -57,17 +92,33 @@ def canon(col: str) -> str:
 
 def buscar_columna(df: pd.DataFrame, *keywords: str) -> str | None:
     """Devuelve el primer nombre de columna que contenga *todos* los keywords (canon)."""
+    columnas = list(df.columns)
+    return _buscar_canonico(columnas, [canon(c) for c in columnas], *keywords)
+
+
+def _buscar_canonico(columnas: list, canonicos: list[str], *keywords: str) -> str | None:
+    """Como ``buscar_columna`` pero con los encabezados ya canonizados (una vez por hoja)."""
     kws = [canon(k) for k in keywords]
-    for original in df.columns:
-        c = canon(original)
+    for original, c in zip(columnas, canonicos):
         if all(k in c for k in kws):
             return original
     return None
 
+
+def _texto(serie: pd.Series) -> pd.Series:
+    """Equivalente por columna de ``str(valor)`` (NaN → 'nan', None → 'None')."""
+    return serie.astype(object).map(str)
+
 # ------------------------------------------------------------------
 #  Parseo de Transaction Reference  →  (serie, número)
 # ------------------------------------------------------------------
 
+# Patrón SERIE-NUMERO  (F001-5068, B123-45, etc.)
+_RE_SERIE_NUMERO = re.compile(r"^([A-Z0-9]{1,10})[-](\d{1,20})$")
+# Patrón compacto F0015068
+_RE_SERIE_COMPACTA = re.compile(r"^([A-Z]{1}\d{3})(\d{1,20})$")
+
+
 def parse_doc(ref_raw: str) -> tuple[str, str]:
     """Extrae serie y número desde Transaction Reference (normalizado)."""
     if pd.isna(ref_raw):
@@ -79,12 +130,12 @@ def parse_doc(ref_raw: str) -> tuple[str, str]:
     ref = ref.replace("/", "-").replace(" ", "-")
 
     # Patrón SERIE-NUMERO  (F001-5068, B123-45, etc.)
-    m = re.match(r"^([A-Z0-9]{1,10})[-](\d{1,20})$", ref)
+    m = _RE_SERIE_NUMERO.match(ref)
     if m:
         return m.group(1), m.group(2).lstrip("0") or "0"
 
     # Patrón compacto F0015068
-    m = re.match(r"^([A-Z]{1}\d{3})(\d{1,20})$", ref)
+    m = _RE_SERIE_COMPACTA.match(ref)
     if m:
         return m.group(1), m.group(2).lstrip("0") or "0"
 
@@ -94,92 +145,631 @@ def parse_doc(ref_raw: str) -> tuple[str, str]:
 
     return "", "0"
 
+
+def parse_docs(refs: pd.Series) -> pd.DataFrame:
+    """Versión por lote de ``parse_doc``: devuelve columnas serie, numero y tipo_cmp.
+
+    Cada referencia distinta se parsea una sola vez y el resultado se reparte
+    a todas las líneas que la comparten.
+    """
+    codigos, unicos = pd.factorize(_texto(refs))
+    ref = (
+        pd.Series(np.asarray(unicos, dtype=object), dtype=object)
+          .str.strip().str.upper()
+          .str.replace("/", "-", regex=False).str.replace(" ", "-", regex=False)
+    )
+    m_guion = ref.str.extract(_RE_SERIE_NUMERO.pattern)
+    m_compacta = ref.str.extract(_RE_SERIE_COMPACTA.pattern)
+    es_guion = m_guion[0].notna()
+    es_compacta = ~es_guion & m_compacta[0].notna()
+    es_digitos = ~es_guion & ~es_compacta & ref.str.isdigit().astype(bool)
+
+    serie = m_guion[0].where(es_guion, m_compacta[0].where(es_compacta, ""))
+    numero = m_guion[1].where(es_guion, m_compacta[1].where(es_compacta, ref.where(es_digitos, "")))
+    numero = numero.astype(object).str.lstrip("0")
+    numero = numero.mask(numero == "", "0")
+
+    inicial = serie.astype(object).str[:1]
+    tipo_cmp = np.select([inicial == "F", inicial == "B", inicial == "T"], ["01", "03", "12"], default="00")
+
+    return pd.DataFrame({
+        "serie": np.asarray(serie, dtype=object)[codigos],
+        "numero": np.asarray(numero, dtype=object)[codigos],
+        "tipo_cmp": np.asarray(tipo_cmp, dtype=object)[codigos],
+    }, index=refs.index)
+
 # ------------------------------------------------------------------
-# Procesamiento principal
+# Métricas por etapa (tiempo de reloj, CPU y contadores)
 # ------------------------------------------------------------------
 
-def procesar_excel(archivo: Path) -> None:
-    logging.info(f"Procesando {archivo.name}")
-    mes = extraer_mes_archivo(archivo.stem)
-    if not mes:
-        logging.warning("No se pudo detectar el mes en el nombre de archivo – se omite.")
-        return
+@contextmanager
+def medir_etapa(metricas: list[dict] | None, etapa: str, **contadores) -> Iterator[dict]:
+    """Registra en *metricas* el tiempo de pared/CPU de la etapa y los contadores que se agreguen.
 
+    El dict entregado admite claves como ``filas_salida`` o ``bytes`` dentro del bloque.
+    El CPU es el del hilo que ejecuta la etapa (el escritor del pipeline corre en paralelo).
+    Con ``metricas=None`` no se registra nada.
+    """
+    registro = {"etapa": etapa, **contadores}
+    inicio_pared, inicio_cpu = time.perf_counter(), time.thread_time()
     try:
-        xls = pd.ExcelFile(archivo)
-        diario_df = xls.parse(sheet_name=4)  # Hoja 5: Libro Diario
-        pc_df     = xls.parse(sheet_name=5)  # Hoja 6: Plan de Cuentas
-    except Exception as e:
-        logging.error(f"Error leyendo hojas: {e}")
-        return
+        yield registro
+    finally:
+        registro["pared_s"] = round(time.perf_counter() - inicio_pared, 6)
+        registro["cpu_s"] = round(time.thread_time() - inicio_cpu, 6)
+        if metricas is not None:
+            metricas.append(registro)
 
-    diario_df.columns = [str(c) for c in diario_df.columns]
-    pc_df.columns     = [str(c) for c in pc_df.columns]
 
-    # ---------------- Plan de cuentas ----------------
-    col_cuenta_pc     = buscar_columna(pc_df, "cuenta peruana") or pc_df.columns[2]
+CAMPOS_METRICAS = ["archivo", "mes", "etapa", "pared_s", "cpu_s", "filas_entrada", "filas_salida", "bytes", "aciertos"]
+
+
+def guardar_metricas(ruta: Path, resultados: list[tuple[Path, dict | None]]) -> None:
+    """Vuelca las métricas de la corrida a *ruta* (CSV si termina en .csv, si no JSON)."""
+    filas = [
+        {"archivo": archivo.name, **registro}
+        for archivo, resumen in resultados if resumen is not None
+        for registro in resumen.get("metricas", [])
+    ]
+    if ruta.suffix.lower() == ".csv":
+        with open(ruta, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CAMPOS_METRICAS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(filas)
+    else:
+        ruta.write_text(json.dumps({"metricas": filas}, indent=2, ensure_ascii=False), encoding="utf-8")
+    logging.info(f"Métricas → {ruta}")
+
+
+# ------------------------------------------------------------------
+# Avisos agregados (contadores + filas de ejemplo, un mensaje por archivo)
+# ------------------------------------------------------------------
+
+def registrar_aviso(avisos: dict, clave: str, mensaje: str, filas: Iterable[int]) -> None:
+    """Acumula en *avisos* los números de fila afectados por el aviso *clave*."""
+    aviso = avisos.setdefault(clave, {"mensaje": mensaje, "filas": []})
+    aviso["filas"].extend(int(f) for f in filas)
+
+
+def emitir_avisos(avisos: dict, detalle: bool = False) -> dict[str, int]:
+    """Emite un warning por aviso con su cantidad y filas de ejemplo; devuelve {clave: cantidad}."""
+    for aviso in avisos.values():
+        filas = aviso["filas"]
+        muestra = filas if detalle else filas[:MUESTRAS_AVISO]
+        resto = "" if len(muestra) == len(filas) else ", …"
+        logging.warning(f"{len(filas)} {aviso['mensaje']} (filas {', '.join(map(str, muestra))}{resto})")
+    return {clave: len(aviso["filas"]) for clave, aviso in avisos.items()}
+
+
+# ------------------------------------------------------------------
+# Lectura selectiva de la entrada (libro Excel o tablas CSV / Parquet)
+# ------------------------------------------------------------------
+
+# Número de fila en la hoja de la primera fila de datos. En CSV/Parquet la "fila"
+# es el número de registro contando el encabezado como 1: coincide con la línea del
+# CSV salvo que haya líneas en blanco (read_csv las salta) o glosas de varias líneas.
+PRIMERA_FILA_DATOS = 2
+
+OPCIONES_CSV = {"sep": ",", "encoding": "utf-8-sig"}
+# Las fechas de texto del CSV son dd/mm/aaaa (como las exporta el ERP); las ISO
+# (aaaa-mm-dd …) se leen igual. En Excel las fechas ya llegan como fechas.
+DIA_PRIMERO_CSV = True
+
+# dtypes explícitos por columna lógica del Diario (None → inferencia de pandas).
+# Solo se fijan donde el resultado no depende del tipo inferido.
+TIPOS_DIARIO = {"cuenta": object, "journal_num": object}
+
+# Códigos enteros que un CSV trae como float ("822053.0", típico de columnas con vacíos)
+ENTERO_COMO_FLOAT = r"^(\d+)\.0+$"
+
+
+def abrir_entrada(ruta: Path) -> pd.ExcelFile | dict[int, Path]:
+    """Abre el libro Excel de *ruta* o ubica sus tablas CSV/Parquet."""
+    tablas = tablas_entrada(ruta)
+    return pd.ExcelFile(ruta) if tablas is None else tablas
+
+
+def tamano_entrada(ruta: Path) -> int:
+    tablas = tablas_entrada(ruta)
+    return ruta.stat().st_size if tablas is None else sum(t.stat().st_size for t in tablas.values())
+
+
+def _tabla(fuente: dict[int, Path], hoja: int) -> Path:
+    if hoja not in fuente:
+        raise FileNotFoundError(f"no se encontró la tabla '{TABLAS_ENTRADA[hoja]}' (.csv o .parquet)")
+    return fuente[hoja]
+
+
+def leer_encabezados(fuente: pd.ExcelFile | dict[int, Path], hoja: int) -> pd.DataFrame:
+    """Lee solo la fila de encabezados de *hoja* (DataFrame vacío con las columnas)."""
+    if isinstance(fuente, pd.ExcelFile):
+        return fuente.parse(sheet_name=hoja, nrows=0)
+    ruta = _tabla(fuente, hoja)
+    if ruta.suffix.lower() == ".parquet":
+        return pd.DataFrame(columns=_columnas_parquet(ruta))
+    return pd.read_csv(ruta, nrows=0, **OPCIONES_CSV)
+
+
+def _columnas_parquet(ruta: Path) -> list[str]:
+    """Nombres de columna del Parquet leyendo solo el esquema, con el motor que use
+    ``pd.read_parquet`` (pyarrow o, si no está, fastparquet)."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        import fastparquet
+        return list(fastparquet.ParquetFile(ruta).columns)
+    return pq.read_schema(ruta).names
+
+
+def resolver_columnas_plan(pc_df: pd.DataFrame, usar_cache: bool = True) -> tuple[str, str]:
+    """Devuelve (columna de código, columna de nombre) del Plan de Cuentas."""
+    mapeo = _resolver_layout("plan", [str(c) for c in pc_df.columns], _resolver_plan, usar_cache)
+    return mapeo["cuenta"], mapeo["nombre"]
+
+
+def _resolver_plan(columnas: list[str], canonicos: list[str]) -> dict[str, str]:
+    col_cuenta_pc     = _buscar_canonico(columnas, canonicos, "cuenta peruana") or columnas[2]
 
     # Tomar "Nombre de Cuenta Contable" (preferencia por encabezado; fallback a columna D)
     col_nombre_cuenta = (
-        buscar_columna(pc_df, "nombre", "cuenta", "contable")
-        or (pc_df.columns[3] if len(pc_df.columns) > 3 else pc_df.columns[1])
+        _buscar_canonico(columnas, canonicos, "nombre", "cuenta", "contable")
+        or (columnas[3] if len(columnas) > 3 else columnas[1])
     )
-    logging.info(f"Plan de Cuentas: usando columna de NOMBRE = '{col_nombre_cuenta}'")
+    return {"cuenta": col_cuenta_pc, "nombre": col_nombre_cuenta}
+
+
+def resolver_columnas_diario(diario_df: pd.DataFrame, usar_cache: bool = True) -> dict[str, str | None]:
+    """Ubica las columnas del Libro Diario por palabras clave (None si no existe)."""
+    return _resolver_layout("diario", [str(c) for c in diario_df.columns], _resolver_diario, usar_cache)
+
+
+def _resolver_diario(columnas: list[str], canonicos: list[str]) -> dict[str, str | None]:
+    def buscar(*keywords: str) -> str | None:
+        return _buscar_canonico(columnas, canonicos, *keywords)
+
+    # Glosa: preferimos "Description.1" (AA); si no, "Description" genérica.
+    col_glosa = "Description.1" if "Description.1" in columnas else buscar("description")
+
+    return {
+        "cuenta":       buscar("cuenta peruana"),
+        "fecha":        buscar("transaction date"),
+        "glosa":        col_glosa,
+        "monto":        buscar("base amount") or buscar("transaction amount"),
+        "journal_num":  buscar("journal number"),
+        "journal_type": buscar("journal type"),
+        "currency":     buscar("transaction currency code"),
+        "ref_doc":      buscar("transaction reference"),
+    }
+
+
+def _resolver_layout(hoja: str, columnas: list[str], resolver, usar_cache: bool) -> dict:
+    """Resuelve columnas una sola vez por layout (firma de encabezados), con caché en disco."""
+    clave = f"{hoja}:{firma_encabezados(columnas)}"
+    layouts = cargar_layouts(usar_cache)
+    if clave not in layouts:
+        layouts[clave] = resolver(columnas, [canon(c) for c in columnas])
+        if usar_cache:
+            guardar_layout(clave, layouts[clave])
+    return dict(layouts[clave])
+
+
+def leer_columnas(fuente: pd.ExcelFile | dict[int, Path], hoja: int, encabezados: pd.DataFrame,
+                  tipos: dict[str, object], fechas: Iterable[str] = ()) -> pd.DataFrame:
+    """Parsea de *hoja* solo las columnas de *tipos* ({nombre: dtype o None}).
+
+    Las columnas *fechas* de un CSV se convierten con ``DIA_PRIMERO_CSV``; los textos
+    que no son fechas se dejan tal cual (quedan como fecha inválida al generar).
+    """
+    originales = list(encabezados.columns)
+    nombres = [str(c) for c in originales]
+    posiciones = sorted({nombres.index(c) for c in tipos})
+    dtype = {originales[i]: tipos[nombres[i]] for i in posiciones if tipos[nombres[i]] is not None}
+    if isinstance(fuente, pd.ExcelFile):
+        df = fuente.parse(sheet_name=hoja, usecols=posiciones, dtype=dtype or None)
+    elif _tabla(fuente, hoja).suffix.lower() == ".parquet":
+        df = pd.read_parquet(fuente[hoja], columns=[originales[i] for i in posiciones])
+        df = df.astype(dtype) if dtype else df
+        # fastparquet deja None en los textos vacíos; pyarrow, Excel y CSV dan NaN
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    else:
+        df = pd.read_csv(fuente[hoja], usecols=posiciones, dtype=dtype or None, **OPCIONES_CSV)
+        # en el CSV los códigos llegan como texto: se quita el ".0" igual que normalizar_codigo
+        # con los float enteros de Excel/Parquet, si no las cuentas no coinciden con el Plan
+        for col in (originales[i] for i in posiciones if tipos[nombres[i]] is object):
+            df[col] = df[col].str.replace(ENTERO_COMO_FLOAT, r"\1", regex=True)
+        for col in fechas:
+            convertidas = _parsear_fechas(df[col], dia_primero=DIA_PRIMERO_CSV)
+            legibles = convertidas.notna() | df[col].isna()
+            df[col] = convertidas if legibles.all() else convertidas.astype(object).where(legibles, df[col])
+    df.columns = [nombres[i] for i in posiciones]
+    return df
+
+# ------------------------------------------------------------------
+# Caché de hojas parseadas (clave: hash del archivo + hoja)
+# ------------------------------------------------------------------
+
+# Se incrementa cuando cambia qué columnas o dtypes se leen, para invalidar la caché.
+VERSION_CACHE = 4
 
-    pc_df = pc_df.fillna("")
-    pc_df["codigo_cuenta"] = pc_df[col_cuenta_pc].map(normalizar_codigo)
-    pc_df = pc_df[pc_df["codigo_cuenta"] != ""]
+
+@functools.cache
+def _clave_cache(directorio: Path) -> bytes:
+    """Clave de firma de los pickles de *directorio*; se crea (solo legible por el usuario) la primera vez."""
+    ruta = directorio / "clave"
+    if not ruta.exists():
+        directorio.mkdir(mode=0o700, parents=True, exist_ok=True)
+        temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.tmp")
+        with os.fdopen(os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(secrets.token_bytes(32))
+        os.replace(temporal, ruta)  # si otro proceso la crea a la vez, gana una; lo firmado con la otra se relee
+    return ruta.read_bytes()
+
+
+def _guardar_pickle(objeto, ruta: Path) -> None:
+    """Escribe *objeto* en *ruta* (atómico) precedido de su firma HMAC-SHA256."""
+    cuerpo = pickle.dumps(objeto, protocol=pickle.HIGHEST_PROTOCOL)
+    firma = hmac.new(_clave_cache(ruta.parent), cuerpo, hashlib.sha256).digest()
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.tmp")
+    temporal.write_bytes(firma + cuerpo)
+    os.replace(temporal, ruta)
+
+
+def _leer_pickle(ruta: Path):
+    """Lee un pickle escrito por ``_guardar_pickle``; si la firma no coincide no lo deserializa."""
+    datos = ruta.read_bytes()
+    firma, cuerpo = datos[:32], datos[32:]
+    if not hmac.compare_digest(firma, hmac.new(_clave_cache(ruta.parent), cuerpo, hashlib.sha256).digest()):
+        raise ValueError("firma inválida")
+    return pickle.loads(cuerpo)
+
+
+def _ruta_cache(huella: str, hoja: int) -> Path:
+    return CACHE_DIR / f"{huella}_{hoja}_v{VERSION_CACHE}.pkl"
+
+
+def cache_cargar(huella: str, hoja: int) -> tuple[pd.DataFrame, pd.DataFrame] | None:
+    """Devuelve (encabezados, columnas leídas) de la caché, o None si no existe."""
+    ruta = _ruta_cache(huella, hoja)
+    try:
+        encabezados, df = _leer_pickle(ruta)
+        os.utime(ruta)  # marca de uso para el desalojo LRU
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Caché ilegible ({ruta.name}): {e} – se relee el Excel.")
+        return None
+    return encabezados, df
+
+
+def cache_guardar(huella: str, hoja: int, encabezados: pd.DataFrame, df: pd.DataFrame) -> None:
+    """Guarda la hoja parseada y desaloja las entradas menos usadas si se supera CACHE_MAX_BYTES."""
+    CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    ruta = _ruta_cache(huella, hoja)
+    _guardar_pickle((encabezados, df), ruta)
+
+    entradas = []
+    for entrada in CACHE_DIR.glob("*.pkl"):
+        try:
+            st = entrada.stat()
+        except FileNotFoundError:
+            continue
+        entradas.append((st.st_mtime, st.st_size, entrada))
+    total = sum(tam for _, tam, _ in entradas)
+    for _, tam, entrada in sorted(entradas):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if entrada == ruta:
+            continue
+        entrada.unlink(missing_ok=True)
+        total -= tam
+
+
+# Mapeos de columnas ya resueltos, por firma de encabezados (memoria del proceso)
+_LAYOUTS: dict[str, dict] = {}
+_LAYOUTS_DISCO_LEIDO = False
+ARCHIVO_LAYOUTS = "layouts_columnas.json"
+
+
+def firma_encabezados(columnas: list[str]) -> str:
+    """Hash de la lista ordenada de encabezados de una hoja."""
+    return hashlib.sha1("\x1f".join(columnas).encode("utf-8")).hexdigest()
+
+
+def _leer_layouts_disco() -> dict[str, dict]:
+    try:
+        datos = json.loads((CACHE_DIR / ARCHIVO_LAYOUTS).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Layouts de columnas ilegibles: {e} – se resuelven de nuevo.")
+        return {}
+    return datos.get("layouts", {}) if datos.get("version") == VERSION_CACHE else {}
+
+
+def cargar_layouts(usar_cache: bool = True) -> dict[str, dict]:
+    """Devuelve los mapeos conocidos; la primera vez agrega los persistidos en CACHE_DIR."""
+    global _LAYOUTS_DISCO_LEIDO
+    if usar_cache and not _LAYOUTS_DISCO_LEIDO:
+        _LAYOUTS_DISCO_LEIDO = True
+        for clave, mapeo in _leer_layouts_disco().items():
+            _LAYOUTS.setdefault(clave, mapeo)
+    return _LAYOUTS
+
+
+def guardar_layout(clave: str, mapeo: dict) -> None:
+    """Agrega un mapeo al archivo de layouts (relee y reemplaza de forma atómica)."""
+    try:
+        CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        layouts = _leer_layouts_disco()
+        layouts[clave] = mapeo
+        ruta = CACHE_DIR / ARCHIVO_LAYOUTS
+        temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.tmp")
+        temporal.write_text(json.dumps({"version": VERSION_CACHE, "layouts": layouts}, indent=1,
+                                       ensure_ascii=False), encoding="utf-8")
+        os.replace(temporal, ruta)
+    except OSError as e:
+        logging.warning(f"No se pudo guardar el layout de columnas: {e}")
+
+
+# ------------------------------------------------------------------
+# Registros PLE: especificación de campos y serialización por columnas
+# ------------------------------------------------------------------
+
+# Cada campo es ("columna", nombre) → texto de esa columna del DataFrame,
+# ("centimos", nombre) → entero en céntimos escrito como "123.45", o
+# ("fijo", valor) → el mismo valor en todas las líneas.
+REGISTRO_DIARIO = [
+    ("columna", "periodo"),      # 1 – Periodo ajustado por línea
+    ("columna", "cuo"),          # 2 – CUO
+    ("columna", "correlativo"),  # 3 – Correlativo
+    ("columna", "cuenta"),       # 4 – Cuenta contable
+    ("fijo", ""), ("fijo", ""),  # 5‑6 – subcuenta / CCosto (vacío)
+    ("columna", "moneda"),       # 7 – Moneda
+    ("fijo", ""), ("fijo", ""),  # 8‑9 – TC y glosa TC (vacío)
+    ("columna", "tipo_cmp"),     # 10 – Tipo de Comprobante
+    ("columna", "serie"),        # 11 – Serie
+    ("columna", "numero"),       # 12 – Número
+    ("fijo", ""), ("fijo", ""),  # 13‑14 – Doc ref (vacío)
+    ("columna", "fecha"),        # 15 – Fecha
+    ("columna", "glosa"),        # 16 – Glosa
+    ("fijo", ""),                # 17 – Código libro (vacío)
+    ("centimos", "debe"),        # 18 – Debe
+    ("centimos", "haber"),       # 19 – Haber
+    ("fijo", ""),                # 20 – Campo libre
+    ("columna", "estado"),       # 21 – Estado
+]
+
+REGISTRO_PLAN = [
+    ("columna", "periodo"),      # 1 – Periodo
+    ("columna", "codigo"),       # 2 – Código de cuenta
+    ("columna", "nombre"),       # 3 – Descripción de la cuenta
+    ("fijo", "01"),              # 4 – Código del plan de cuentas
+    ("fijo", ""), ("fijo", ""),  # 5‑6 – (vacío)
+    ("fijo", ""),                # 7 – (vacío)
+    ("fijo", "1"),               # 8 – Estado
+    ("fijo", ""),                # 9 – Campo libre
+]
+
+
+def compilar_registro(registro: list[tuple[str, str]]) -> tuple[list[tuple[str, str, str]], str]:
+    """Agrupa los campos fijos en tramos de texto: ([(texto previo, tipo, columna)], texto final)."""
+    tramos = []
+    texto = ""
+    for tipo, valor in registro:
+        if tipo == "fijo":
+            texto += f"{valor}|"
+        else:
+            tramos.append((texto, tipo, valor))
+            texto = "|"
+    return tramos, texto
+
+
+def serializar_registro(df: pd.DataFrame, registro: list[tuple[str, str]]) -> list[str]:
+    """Arma las líneas "|"-delimitadas de *df* según *registro*, columna por columna."""
+    if df.empty:
+        return []
+    tramos, final = compilar_registro(registro)
+    lineas = np.full(len(df), "", dtype=object)
+    for texto, tipo, columna in tramos:
+        valores = df[columna].to_numpy()
+        valores = formatear_centimos(valores) if tipo == "centimos" else valores.astype(object)
+        lineas = lineas + texto + valores if texto else lineas + valores
+    return (lineas + final).tolist() if final else lineas.tolist()
+
+
+# ------------------------------------------------------------------
+# Plan de Cuentas (5.3)
+# ------------------------------------------------------------------
+
+def preparar_plan(pc_df: pd.DataFrame, col_cuenta_pc: str, col_nombre_cuenta: str,
+                  orden: str = ORDEN_PLAN) -> pd.DataFrame:
+    """Normaliza los códigos del Plan y deja un registro por código (el de nombre más largo).
+
+    La selección es un groupby/idxmax sobre el largo del nombre (ante empate gana el
+    primero en la hoja); solo se ordena por código si *orden* es "codigo".
+    """
+    codigos = normalize_accounts(pc_df[col_cuenta_pc])
+    nombres = pc_df[col_nombre_cuenta].fillna("")
+    validos = (codigos != "").to_numpy()
+    before = int(validos.sum())
 
     # ------------------ eliminar duplicados de código de cuenta ------------------
     # preferir nombre más largo si hay múltiples registros para un mismo código
-    pc_df["nombre_temp"] = pc_df.get(col_nombre_cuenta, "").astype(str).fillna("").str.strip()
-    before = len(pc_df)
-    # ordenar para que el nombre más descriptivo (más largo) quede primero
-    pc_df["name_len"] = pc_df["nombre_temp"].str.len()
-    pc_df = (
-        pc_df.sort_values(by=["codigo_cuenta", "name_len"], ascending=[True, False])
-             .drop_duplicates(subset=["codigo_cuenta"], keep="first")
-    )
-    after = len(pc_df)
+    posiciones = np.flatnonzero(validos)
+    largo = pd.Series(_texto(nombres).str.strip().str.len().to_numpy()[validos], index=posiciones)
+    elegidos = largo.groupby(codigos.to_numpy()[validos], sort=(orden == "codigo")).idxmax().to_numpy()
+
+    resultado = pc_df.iloc[elegidos].assign(**{
+        col_nombre_cuenta: nombres.iloc[elegidos].to_numpy(),
+        "codigo_cuenta": codigos.iloc[elegidos].to_numpy(),
+    })
+    after = len(resultado)
     logging.info(f"Plan de Cuentas: removidos {before - after} duplicados de código de cuenta (quedan {after}).")
-    # limpiar columnas auxiliares
-    pc_df = pc_df.drop(columns=["nombre_temp", "name_len"] )
+    return resultado
 
-    # ---------------- Libro Diario ----------------
-    col_cuenta_diario = buscar_columna(diario_df, "cuenta peruana")
-    col_fecha         = buscar_columna(diario_df, "transaction date")
 
-    # Glosa: preferimos "Description.1" (AA); si no, "Description" genérica.
-    col_glosa = "Description.1" if "Description.1" in diario_df.columns else buscar_columna(diario_df, "description")
+def sufijos_plan(pc_df: pd.DataFrame, col_nombre_cuenta: str) -> list[str]:
+    """Parte fija de cada línea 5.3 (todo lo que va después del periodo)."""
+    campos = pd.DataFrame({"codigo": pc_df["codigo_cuenta"].astype(object),
+                           "nombre": _texto(pc_df[col_nombre_cuenta]).str.strip()})
+    # el periodo (campo 1) es lo único que cambia entre meses
+    return serializar_registro(campos, REGISTRO_PLAN[1:])
 
-    col_debe_credit   = buscar_columna(diario_df, "debit/credit")
-    col_monto = buscar_columna(diario_df, "base amount") or buscar_columna(diario_df, "transaction amount")
-    col_journal_num   = buscar_columna(diario_df, "journal number")
-    col_journal_type  = buscar_columna(diario_df, "journal type")
-    col_currency      = buscar_columna(diario_df, "transaction currency code")
-    col_ref_doc       = buscar_columna(diario_df, "transaction reference")
 
-    required = [col_cuenta_diario, col_fecha, col_glosa, col_monto, col_journal_num, col_journal_type]
-    if any(c is None for c in required):
-        logging.error("Faltan columnas requeridas en Diario – verifica nombres.")
-        logging.error("Columnas detectadas → cuenta=%s, fecha=%s, glosa=%s, monto=%s, jnum=%s, jtype=%s",
-                      col_cuenta_diario, col_fecha, col_glosa, col_monto, col_journal_num, col_journal_type)
-        logging.info("Encabezados disponibles en Diario: %s", list(diario_df.columns))
-        return
+def generar_lineas_plan(pc_df: pd.DataFrame, col_nombre_cuenta: str, periodo_plan: str) -> Iterator[str]:
+    """Genera las líneas 5.3 del Plan de Cuentas ya deduplicado."""
+    for sufijo in sufijos_plan(pc_df, col_nombre_cuenta):
+        yield f"{periodo_plan}|{sufijo}"
+
+
+# Planes ya procesados en esta corrida, por huella de contenido
+_PLANES: dict[str, dict] = {}
+
+
+def huella_plan(pc_df: pd.DataFrame, col_cuenta_pc: str, col_nombre_cuenta: str, orden: str) -> str:
+    """Hash del contenido leído del Plan (columnas de código y nombre) y del orden pedido."""
+    h = hashlib.sha256(f"{col_cuenta_pc}\x1f{col_nombre_cuenta}\x1f{orden}".encode("utf-8"))
+    for col in dict.fromkeys([col_cuenta_pc, col_nombre_cuenta]):
+        h.update(pickle.dumps(pc_df[col].to_numpy(dtype=object), protocol=4))
+    return h.hexdigest()
+
+
+def obtener_plan(pc_df: pd.DataFrame, col_cuenta_pc: str, col_nombre_cuenta: str,
+                 orden: str = ORDEN_PLAN, usar_cache: bool = True) -> dict:
+    """Plan procesado (cuentas válidas y líneas 5.3 sin periodo), reutilizado por contenido.
+
+    Se procesa una vez por corrida para cada contenido distinto y, con *usar_cache*,
+    se persiste en CACHE_DIR para las corridas siguientes.
+    """
+    huella = huella_plan(pc_df, col_cuenta_pc, col_nombre_cuenta, orden)
+    if huella in _PLANES:
+        logging.info("Plan de Cuentas: mismo contenido que uno ya procesado, se reutiliza.")
+        return _PLANES[huella]
+    ruta = CACHE_DIR / f"plan_{huella}_v{VERSION_CACHE}.pkl"
+    plan = None
+    if usar_cache:
+        try:
+            plan = _leer_pickle(ruta)
+            os.utime(ruta)
+            logging.info("Plan de Cuentas procesado leído desde caché.")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Caché de plan ilegible ({ruta.name}): {e} – se reprocesa.")
+    if plan is None:
+        pc_df = preparar_plan(pc_df, col_cuenta_pc, col_nombre_cuenta, orden)
+        plan = {
+            "huella": huella,
+            "cuentas_validas": frozenset(pc_df["codigo_cuenta"].values),
+            "sufijos": sufijos_plan(pc_df, col_nombre_cuenta),
+        }
+        if usar_cache:
+            try:
+                CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+                _guardar_pickle(plan, ruta)
+            except OSError as e:
+                logging.warning(f"No se pudo guardar la caché del plan: {e}")
+    _PLANES[huella] = plan
+    return plan
+
+
+def cargar_plan(ruta: Path, orden: str = ORDEN_PLAN, usar_cache: bool = True) -> dict:
+    """Lee y procesa una sola vez el Plan de Cuentas (hoja 6) de *ruta* para toda la corrida.
+
+    *ruta* puede ser un libro, una entrada CSV/Parquet o directamente la tabla del plan.
+    """
+    if ruta.is_file() and ruta.suffix.lower() in EXTENSIONES_TABLA:
+        fuente = {HOJA_PLAN: ruta}
+    else:
+        fuente = abrir_entrada(ruta)
+    pc_encab = leer_encabezados(fuente, HOJA_PLAN)
+    col_cuenta_pc, col_nombre_cuenta = resolver_columnas_plan(pc_encab, usar_cache)
+    logging.info(f"Plan de Cuentas compartido: {ruta.name} (NOMBRE = '{col_nombre_cuenta}')")
+    pc_df = leer_columnas(fuente, HOJA_PLAN, pc_encab, {col_cuenta_pc: object, col_nombre_cuenta: None})
+    return obtener_plan(pc_df, col_cuenta_pc, col_nombre_cuenta, orden, usar_cache)
+
+
+def longitudes_cuentas(plan: dict) -> list[int]:
+    """Largos distintos de los códigos del Plan, de mayor a menor (se calcula una vez por plan)."""
+    if "longitudes" not in plan:
+        plan["longitudes"] = sorted({len(c) for c in plan["cuentas_validas"]}, reverse=True)
+    return plan["longitudes"]
+
+
+def cuentas_padre(cuentas: pd.Series, cuentas_validas: frozenset, longitudes: list[int]) -> pd.Series:
+    """Para cada código normalizado, el código válido más largo que es prefijo suyo.
+
+    Los códigos válidos se devuelven tal cual y los que no tienen prefijo válido
+    como "". Se resuelve sobre los códigos distintos con una pasada vectorizada por
+    cada largo presente en el Plan, no prefijo por prefijo.
+    """
+    codigos, unicos = pd.factorize(cuentas)
+    unicos = pd.Series(np.asarray(unicos, dtype=object), dtype=object)
+    padre = unicos.where(unicos.isin(cuentas_validas), "")
+    for largo in longitudes:
+        pendientes = unicos[(padre == "") & (unicos.str.len() > largo)]
+        if pendientes.empty:
+            continue
+        prefijo = pendientes.str[:largo]
+        encontrados = prefijo.isin(cuentas_validas)
+        padre[prefijo.index[encontrados]] = prefijo[encontrados]
+    return pd.Series(padre.to_numpy()[codigos], index=cuentas.index, dtype=object)
+
+
+def subir_cuentas_a_padre(diario_df: pd.DataFrame, col_cuenta: str, plan: dict) -> pd.DataFrame:
+    """Reemplaza en *col_cuenta* las subcuentas que no están en el Plan por su cuenta padre."""
+    cuentas = normalize_accounts(diario_df[col_cuenta])
+    padres = cuentas_padre(cuentas, plan["cuentas_validas"], longitudes_cuentas(plan))
+    subir = (padres != "") & (padres != cuentas)
+    if not subir.any():
+        return diario_df
+    logging.info(f"{int(subir.sum())} líneas de {cuentas[subir].nunique()} subcuentas fuera del Plan "
+                 f"imputadas a su cuenta padre.")
+    return diario_df.assign(**{col_cuenta: diario_df[col_cuenta].astype(object).mask(subir, padres)})
+
+
+# ------------------------------------------------------------------
+# Motores de generación del Libro Diario (5.1)
+# ------------------------------------------------------------------
+
+def _generar_diario_filas(diario_df: pd.DataFrame, columnas: dict, cuentas_validas: set,
+                          ANIO: int, mes: str, metricas: list[dict] | None = None) -> tuple[list[str], dict]:
+    """Motor de referencia: genera las líneas 5.1 fila por fila (iterrows).
+
+    El resumen se acumula dentro del bucle, por eso solo registra la etapa "diario".
+    """
+    with medir_etapa(metricas, "diario", filas_entrada=len(diario_df)) as m:
+        diario_lines, resumen = _bucle_diario_filas(diario_df, columnas, cuentas_validas, ANIO, mes)
+        m["filas_salida"] = len(diario_lines)
+    return diario_lines, resumen
+
+
+AVISO_SIN_NUMERO = "comprobantes con tipo válido sin número: se puso '0' de fallback"
+
+
+def _bucle_diario_filas(diario_df: pd.DataFrame, columnas: dict, cuentas_validas: set,
+                        ANIO: int, mes: str) -> tuple[list[str], dict]:
+    col_cuenta_diario = columnas["cuenta"]
+    col_fecha         = columnas["fecha"]
+    col_glosa         = columnas["glosa"]
+    col_monto         = columnas["monto"]
+    col_journal_num   = columnas["journal_num"]
+    col_journal_type  = columnas["journal_type"]
+    col_currency      = columnas["currency"]
+    col_ref_doc       = columnas["ref_doc"]
 
-    # Año de trabajo (deducido del nombre o fijo 2020 aquí)
-    ANIO = 2020
     dia_final = ultimo_dia_mes(ANIO, int(mes))
-    periodo_plan = f"{ANIO}{mes}{dia_final:02d}"   # 20200131 para plan de cuentas
     periodo_diario = f"{ANIO}{mes}00"              # 20200100 para libro diario (regla SUNAT)
 
     diario_lines = []
     correlativos_tipo: defaultdict[str, int] = defaultdict(int)
-    cuentas_validas = set(pc_df["codigo_cuenta"].values)
-    total_debe_sum = 0.0
-    total_haber_sum = 0.0
+    total_debe_sum = 0
+    total_haber_sum = 0
+    estados: dict[str, dict] = {}
+    avisos: dict[str, dict] = {}
 
-    for _, row in diario_df.iterrows():
+    for indice, row in diario_df.iterrows():
         cuenta = normalizar_codigo(row[col_cuenta_diario])
         if cuenta == "" or cuenta not in cuentas_validas:
             continue
@@ -232,10 +822,11 @@ def procesar_excel(archivo: Path) -> None:
             monto_raw = float(row.get(col_monto, 0))
         except ValueError:
             monto_raw = 0.0
-        if monto_raw >= 0:
-            debe, haber = monto_raw, 0.0
+        monto_cts = a_centimos(monto_raw)
+        if monto_cts >= 0:
+            debe, haber = monto_cts, 0
         else:
-            debe, haber = 0.0, abs(monto_raw)
+            debe, haber = 0, -monto_cts
         total_debe_sum += debe
         total_haber_sum += haber
 
@@ -263,7 +854,7 @@ def procesar_excel(archivo: Path) -> None:
 
         # Si falta número cuando el tipo es válido, se rellena con '0' (campo obligatorio)
         if tipo_cmp != "00" and not num_doc:
-            logging.warning(f"Comprobante tipo {tipo_cmp} sin número: se pondrá '0' de fallback.")
+            registrar_aviso(avisos, "comprobante_sin_numero", AVISO_SIN_NUMERO, [indice + PRIMERA_FILA_DATOS])
             num_doc = "0"
 
         glosa_val = str(row.get(col_glosa, "")).strip()
@@ -283,69 +874,913 @@ def procesar_excel(archivo: Path) -> None:
             fecha_str,      # 15 – Fecha
             glosa_val,      # 16 – Glosa
             "",             # 17 – Código libro (vacío)
-            f"{debe:.2f}",  # 18 – Debe
-            f"{haber:.2f}", # 19 – Haber
+            formato_centimos(debe),  # 18 – Debe
+            formato_centimos(haber), # 19 – Haber
             "",             # 20 – Campo libre
             estado          # 21 – Estado
         ]
         diario_lines.append("|".join(line) + "|")
-    # ----------------‑‑ Guardado archivos ----------------
-      # ------------------ Guardado archivos ----------------
-    # resumen por estado y totales (simula control de SUNAT)
-    from collections import defaultdict as _defaultdict
-
-    estado_counts: dict[str,int] = {}
-    total_debe_estado: dict[str, float] = _defaultdict(float)
-    total_haber_estado: dict[str, float] = _defaultdict(float)
-
-    for l in diario_lines:
-        parts = l.rstrip("\n").split("|")
-        if len(parts) < 22:
-            continue
-        est = parts[21]
-        estado_counts[est] = estado_counts.get(est, 0) + 1
+
+        por_estado = estados.setdefault(estado, {"lineas": 0, "debe": 0, "haber": 0})
+        por_estado["lineas"] += 1
+        por_estado["debe"] += debe
+        por_estado["haber"] += haber
+
+    resumen = {
+        "lineas": len(diario_lines),
+        "total_debe": total_debe_sum,
+        "total_haber": total_haber_sum,
+        "estados": dict(sorted(estados.items())),
+        "avisos": avisos,
+    }
+    return diario_lines, resumen
+
+
+# Montos a partir de este valor absoluto se tratan como inválidos (→ 0.00): los importes
+# del PLE tienen hasta 12 enteros, y así los céntimos y sus sumas caben en int64
+MONTO_MAXIMO = 1e12
+
+
+def a_centimos(valor: float) -> int:
+    """Monto → céntimos enteros, redondeado como ``f"{valor:.2f}"`` (no finitos o fuera de rango → 0)."""
+    if not np.isfinite(valor) or abs(valor) >= MONTO_MAXIMO:
+        return 0
+    return int(Decimal(valor).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+
+
+def montos_a_centimos(monto: np.ndarray) -> np.ndarray:
+    """Versión por columna de ``a_centimos``: array float → int64 en céntimos."""
+    monto = np.where(np.isfinite(monto) & (np.abs(monto) < MONTO_MAXIMO), monto, 0.0)
+    escalado = monto * 100
+    centimos = np.rint(escalado)
+    # monto * 100 puede errar en el último bit: los valores que quedan a un pelo de
+    # ,5 céntimo se redondean sobre el valor binario exacto, como lo hace "%.2f"
+    fraccion = np.abs(escalado - np.trunc(escalado))
+    dudosos = np.abs(fraccion - 0.5) <= np.maximum(np.abs(escalado), 1.0) * 1e-12
+    for i in np.flatnonzero(dudosos):
+        centimos[i] = a_centimos(float(monto[i]))
+    return centimos.astype(np.int64)
+
+
+def formato_centimos(centimos: int) -> str:
+    """Céntimos enteros → texto "123.45"."""
+    signo = "-" if centimos < 0 else ""
+    return f"{signo}{abs(centimos) // 100}.{abs(centimos) % 100:02d}"
+
+
+def _parsear_fechas(serie: pd.Series, dia_primero: bool = False) -> pd.Series:
+    """Convierte toda la columna de fechas a datetime en una sola llamada (inválidas → NaT).
+
+    Con *dia_primero* los textos dd/mm/aaaa se leen día primero; las ISO no cambian.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    if dia_primero:
+        # dayfirst también invierte las ISO ("2020-02-10" → 2 de octubre): esas van sin él
+        iso = _texto(serie).str.match(r"\s*\d{4}-").to_numpy()
+        if iso.any():
+            fechas = _sin_zona(_parsear_fechas(serie.where(iso)))
+            fechas[~iso] = _sin_zona(_parsear_fechas(serie[~iso], dia_primero=True))
+            return fechas
+    try:
+        # "mixed": cada valor se interpreta por separado, igual que pd.to_datetime(valor)
+        return pd.to_datetime(serie, errors="coerce", format="mixed", dayfirst=dia_primero)
+    except ValueError:
+        # zonas horarias mezcladas ("…+05:00" junto a fechas sin zona) no las cubre
+        # errors="coerce": se parsea cada valor distinto y se conserva su hora local,
+        # como hace el bucle de referencia con cada fila
+        codigos, unicos = pd.factorize(serie)
+        fechas = [pd.to_datetime(u, errors="coerce", dayfirst=dia_primero) for u in unicos]
+        locales = [f.tz_localize(None) if not pd.isna(f) and f.tzinfo is not None else f for f in fechas]
+        return pd.Series(pd.DatetimeIndex(locales + [pd.NaT])[codigos], index=serie.index)
+
+
+def _sin_zona(fechas: pd.Series) -> pd.Series:
+    """Fechas con zona horaria → hora local sin zona (las demás, tal cual)."""
+    return fechas.dt.tz_localize(None) if fechas.dt.tz is not None else fechas
+
+
+@functools.cache
+def _dos_digitos():
+    """Tabla "00"‑"99" para formatear días, meses y céntimos por indexación."""
+    return np.array([f"{i:02d}" for i in range(100)], dtype=object)
+
+
+def _clasificar_fechas(serie: pd.Series, ANIO: int, mes: str,
+                       dia_final: int) -> tuple[pd.Series, pd.Series, pd.Series]:
+    """Devuelve (estado, fecha_str, periodo_linea) para toda la columna de fechas de operación."""
+    fechas = _parsear_fechas(serie)
+    valida = fechas.notna().to_numpy()
+    anio_op = fechas.dt.year.fillna(0).to_numpy(dtype=np.int64)
+    mes_op = fechas.dt.month.fillna(0).to_numpy(dtype=np.int64)
+    dia_op = fechas.dt.day.fillna(0).to_numpy(dtype=np.int64)
+
+    # Reglas: periodo anterior → estado 8 con su fecha y periodo; mismo mes → estado 1
+    # con su fecha; sin fecha o periodo posterior → estado 1 con el último día del mes.
+    anterior = valida & ((anio_op < ANIO) | ((anio_op == ANIO) & (mes_op < int(mes))))
+    mismo_mes = valida & (anio_op == ANIO) & (mes_op == int(mes))
+
+    anio_txt = anio_op.astype(str).astype(object)
+    mes_txt = _dos_digitos()[mes_op]
+    fecha_oper_str = _dos_digitos()[dia_op] + "/" + mes_txt + "/" + anio_txt
+
+    fecha_str = np.select([anterior | mismo_mes], [fecha_oper_str],
+                          default=f"{dia_final:02d}/{mes}/{ANIO}")
+    periodo_linea = np.select([anterior], [anio_txt + mes_txt + "00"], default=f"{ANIO}{mes}00")
+    estado = np.where(anterior, "8", "1")
+
+    index = serie.index
+    return (pd.Series(estado, index=index, dtype=object),
+            pd.Series(fecha_str, index=index, dtype=object),
+            pd.Series(periodo_linea, index=index, dtype=object))
+
+
+def formatear_centimos(centimos: np.ndarray) -> np.ndarray:
+    """Versión por columna de ``formato_centimos``: int64 en céntimos → array de textos."""
+    absoluto = np.abs(centimos)
+    texto = (absoluto // 100).astype(str).astype(object) + "." + _dos_digitos()[absoluto % 100]
+    return np.where(centimos < 0, "-" + texto, texto)
+
+
+def resumen_por_estado(estado: pd.Series, debe: np.ndarray, haber: np.ndarray) -> dict:
+    """Conteo de líneas y totales Debe/Haber (enteros en céntimos) por estado, más los generales."""
+    # agrupación por estado con factorize (un solo recorrido de las columnas); sumas enteras exactas
+    codigos, unicos = pd.factorize(np.asarray(estado, dtype=object), sort=True)
+    lineas = np.bincount(codigos, minlength=len(unicos))
+    debe_est = np.zeros(len(unicos), dtype=np.int64)
+    haber_est = np.zeros(len(unicos), dtype=np.int64)
+    np.add.at(debe_est, codigos, debe)
+    np.add.at(haber_est, codigos, haber)
+    return {
+        "lineas": int(len(codigos)),
+        "total_debe": int(np.sum(debe, dtype=np.int64)),
+        "total_haber": int(np.sum(haber, dtype=np.int64)),
+        "estados": {
+            est: {"lineas": int(n), "debe": int(d), "haber": int(h)}
+            for est, n, d, h in zip(unicos, lineas, debe_est, haber_est)
+        },
+    }
+
+
+COLUMNAS_CAMPOS = ["periodo", "cuo", "correlativo", "cuenta", "moneda", "tipo_cmp", "serie",
+                   "numero", "fecha", "glosa", "debe", "haber", "estado"]
+
+
+def calcular_campos_diario(diario_df: pd.DataFrame, columnas: dict, cuentas_validas: set,
+                           ANIO: int, mes: str, contadores_cuo: dict[str, int] | None = None,
+                           avisos: dict | None = None) -> pd.DataFrame:
+    """Calcula por columna los campos 5.1 de las líneas con cuenta válida (debe/haber en céntimos).
+
+    Con *contadores_cuo* ({tipo de journal: líneas ya numeradas}) el correlativo del CUO
+    continúa desde bloques anteriores, y el dict se actualiza con las líneas de este bloque.
+    Las filas con datos corregidos se acumulan en *avisos* (``registrar_aviso``); sin
+    *avisos* se emiten al terminar.
+    """
+    col_cuenta_diario = columnas["cuenta"]
+    col_fecha         = columnas["fecha"]
+    col_glosa         = columnas["glosa"]
+    col_monto         = columnas["monto"]
+    col_journal_num   = columnas["journal_num"]
+    col_journal_type  = columnas["journal_type"]
+    col_currency      = columnas["currency"]
+    col_ref_doc       = columnas["ref_doc"]
+
+    dia_final = ultimo_dia_mes(ANIO, int(mes))
+
+    # ---------------- Filtro de cuentas válidas ----------------
+    cuentas = normalize_accounts(diario_df[col_cuenta_diario])
+    validas = (cuentas != "") & cuentas.isin(cuentas_validas)
+    df = diario_df.loc[validas]
+    cuentas = cuentas.loc[validas]
+    if df.empty:
+        return pd.DataFrame({c: pd.Series([], dtype=np.int64 if c in ("debe", "haber") else object)
+                             for c in COLUMNAS_CAMPOS})
+
+    # ---------------- CUO: tipo de journal + contador por tipo ----------------
+    j_type = _texto(df[col_journal_type]).str.strip().str.upper()
+    contador = j_type.groupby(j_type, sort=False).cumcount() + 1
+    if contadores_cuo is not None:
+        contador += j_type.map(contadores_cuo).fillna(0).astype(np.int64)
+        for tipo, n in j_type.value_counts(sort=False).items():
+            contadores_cuo[tipo] = contadores_cuo.get(tipo, 0) + int(n)
+    cuo = j_type + contador.astype(str).str.zfill(3)
+
+    # ---------------- Correlativo (M/A + JournalNumber) ----------------
+    jnum = df[col_journal_num]
+    jnum_str = _texto(jnum).str.rstrip(".0").where(jnum.notna(), "")
+    if col_ref_doc:
+        ref = df[col_ref_doc]
+        apertura = (
+            ref.map(lambda v: isinstance(v, str)).astype(bool)
+            & _texto(ref).str.upper().str.contains("APERTURA", regex=False)
+        )
+        prefijo = pd.Series(np.where(apertura, "A", "M"), index=df.index, dtype=object)
+    else:
+        prefijo = pd.Series("M", index=df.index, dtype=object)
+    correlativo = prefijo + jnum_str
+
+    # ---------------- Estado + Fecha + Periodo por línea ----------------
+    estado, fecha_str, periodo_linea = _clasificar_fechas(df[col_fecha], ANIO, mes, dia_final)
+
+    # ---------------- Montos – Debe / Haber ----------------
+    monto = montos_a_centimos(montos_float(df[col_monto]))
+    positivo = monto >= 0
+    debe = np.where(positivo, monto, 0)
+    haber = np.where(positivo, 0, -monto)
+
+    # ---------------- Moneda ----------------
+    if col_currency:
+        moneda_val = _texto(df[col_currency]).str.strip().str.upper()
+        moneda = pd.Series(np.select(
+            [moneda_val.str.startswith("USD"),
+             moneda_val.str.startswith("PEN") | moneda_val.str.startswith("SOL"),
+             moneda_val != ""],
+            ["USD", "PEN", moneda_val.str[:3]],
+            default="PEN",
+        ), index=df.index, dtype=object)
+    else:
+        moneda = pd.Series("PEN", index=df.index, dtype=object)
+
+    # ---------------- Tipo, serie y número de comprobante ----------------
+    if col_ref_doc:
+        docs = parse_docs(df[col_ref_doc])
+        serie_doc, num_doc, tipo_cmp = docs["serie"], docs["numero"], docs["tipo_cmp"]
+    else:
+        serie_doc = pd.Series("", index=df.index, dtype=object)
+        num_doc   = pd.Series("", index=df.index, dtype=object)
+        tipo_cmp  = pd.Series("00", index=df.index, dtype=object)
+    sin_numero = (tipo_cmp != "00") & (num_doc == "")
+    if sin_numero.any():
+        propios = {} if avisos is None else avisos
+        registrar_aviso(propios, "comprobante_sin_numero", AVISO_SIN_NUMERO,
+                        df.index[sin_numero.to_numpy()] + PRIMERA_FILA_DATOS)
+        if avisos is None:
+            emitir_avisos(propios)
+        num_doc = num_doc.mask(sin_numero, "0")
+
+    glosa_val = _texto(df[col_glosa]).str.strip()
+
+    return pd.DataFrame({
+        "periodo": periodo_linea, "cuo": cuo, "correlativo": correlativo, "cuenta": cuentas,
+        "moneda": moneda, "tipo_cmp": tipo_cmp, "serie": serie_doc, "numero": num_doc,
+        "fecha": fecha_str, "glosa": glosa_val, "debe": debe, "haber": haber, "estado": estado,
+    }, index=df.index)
+
+
+def armar_lineas_diario(campos: pd.DataFrame) -> list[str]:
+    """Une los campos calculados en las líneas 5.1 separadas por "|"."""
+    return serializar_registro(campos, REGISTRO_DIARIO)
+
+
+def _generar_diario_vectorizado(diario_df: pd.DataFrame, columnas: dict, cuentas_validas: set,
+                                ANIO: int, mes: str, metricas: list[dict] | None = None) -> tuple[list[str], dict]:
+    """Genera las líneas 5.1 con operaciones por columna (salida idéntica a ``_generar_diario_filas``)."""
+    avisos: dict[str, dict] = {}
+    with medir_etapa(metricas, "diario", filas_entrada=len(diario_df)) as m:
+        campos = calcular_campos_diario(diario_df, columnas, cuentas_validas, ANIO, mes, avisos=avisos)
+        lineas = armar_lineas_diario(campos)
+        m["filas_salida"] = len(lineas)
+    with medir_etapa(metricas, "resumen", filas_entrada=len(campos)):
+        resumen = resumen_por_estado(campos["estado"], campos["debe"].to_numpy(), campos["haber"].to_numpy())
+    resumen["avisos"] = avisos
+    return lineas, resumen
+
+
+def acumular_resumen(total: dict, parcial: dict) -> dict:
+    """Suma en *total* el resumen por estado de un bloque (ver ``resumen_por_estado``)."""
+    total["lineas"] += parcial["lineas"]
+    total["total_debe"] += parcial["total_debe"]
+    total["total_haber"] += parcial["total_haber"]
+    for est, tot in parcial["estados"].items():
+        acumulado = total["estados"].setdefault(est, {"lineas": 0, "debe": 0, "haber": 0})
+        for clave in ("lineas", "debe", "haber"):
+            acumulado[clave] += tot[clave]
+    total["estados"] = dict(sorted(total["estados"].items()))
+    return total
+
+
+def lineas_diario_por_bloques(diario_df: pd.DataFrame, columnas: dict, cuentas_validas: set,
+                              ANIO: int, mes: str, filas_por_bloque: int, resumen: dict) -> Iterator[str]:
+    """Genera las líneas 5.1 procesando el Diario en bloques de *filas_por_bloque* filas.
+
+    Los contadores del CUO y el *resumen* (que se completa a medida que se consumen
+    las líneas) continúan entre bloques: la salida es idéntica a la de una sola pasada.
+    """
+    contadores_cuo: dict[str, int] = {}
+    for inicio in range(0, len(diario_df), filas_por_bloque):
+        bloque = diario_df.iloc[inicio:inicio + filas_por_bloque]
+        campos = calcular_campos_diario(bloque, columnas, cuentas_validas, ANIO, mes, contadores_cuo,
+                                        resumen.setdefault("avisos", {}))
+        acumular_resumen(resumen, resumen_por_estado(campos["estado"], campos["debe"].to_numpy(),
+                                                     campos["haber"].to_numpy()))
+        yield from armar_lineas_diario(campos)
+
+
+# Motivos por los que una fila del Diario no llega tal cual al 5.1, en orden de
+# prioridad (cada fila se cuenta con el primero que aplica): las de cuenta se
+# descartan, salvo las subcuentas imputadas a su padre (--subir-a-padre); las de
+# monto / fecha se incluyen con 0.00 / el último día del mes.
+MOTIVOS_RECHAZO = {
+    "cuenta_vacia": True,
+    "cuenta_desconocida": True,
+    "cuenta_subida": False,
+    "monto_invalido": False,
+    "fecha_invalida": False,
+}
+
+
+def _monto_o_nan(valor) -> float:
+    """``float(valor)``, o NaN si no es un número (textos como "abc" o "3,5", None)."""
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def montos_float(serie: pd.Series) -> np.ndarray:
+    """Columna de montos → array float (NaN donde no hay número), convirtiendo solo los valores distintos.
+
+    La usan el motor vectorizado (NaN → 0.00, como el bucle) y la clasificación de rechazos.
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.to_numpy(dtype=float)
+    codigos, unicos = pd.factorize(serie.astype(object), use_na_sentinel=False)
+    return np.array([_monto_o_nan(v) for v in unicos], dtype=float)[codigos]
+
+
+def clasificar_rechazos(diario_df: pd.DataFrame, columnas: dict, cuentas_validas: set,
+                        cuentas_originales: pd.Series | None = None) -> pd.DataFrame:
+    """Filas del Diario descartadas o corregidas: ``fila`` (ver PRIMERA_FILA_DATOS), ``motivo``,
+    ``descartada`` y las columnas originales usadas (cuenta, fecha, monto, journal, ref.).
+
+    *cuentas_originales* es la columna de cuenta antes de ``subir_cuentas_a_padre``: las
+    filas imputadas a su padre salen como ``cuenta_subida``, con ``cuenta_original`` al lado.
+    """
+    cuentas = normalize_accounts(diario_df[columnas["cuenta"]])
+    if cuentas_originales is None:
+        subida = np.zeros(len(cuentas), dtype=bool)
+    else:
+        subida = (normalize_accounts(cuentas_originales) != cuentas).to_numpy()
+    montos = montos_float(diario_df[columnas["monto"]])
+    monto_ok = np.isfinite(montos) & (np.abs(montos) < MONTO_MAXIMO)
+    fecha_ok = _parsear_fechas(diario_df[columnas["fecha"]]).notna().to_numpy()
+
+    condiciones = [
+        (cuentas == "").to_numpy(),
+        ~cuentas.isin(cuentas_validas).to_numpy(),
+        subida,
+        ~monto_ok,
+        ~fecha_ok,
+    ]
+    motivo = np.select(condiciones, list(MOTIVOS_RECHAZO), default="")
+    con_motivo = motivo != ""
+    originales = [c for c in dict.fromkeys(columnas[k] for k in ("cuenta", "fecha", "monto", "journal_num",
+                                                                   "journal_type", "ref_doc")) if c]
+    rechazos = diario_df.loc[con_motivo, originales]
+    rechazos.insert(0, "descartada", pd.Series(motivo[con_motivo], index=rechazos.index).map(MOTIVOS_RECHAZO))
+    rechazos.insert(0, "motivo", motivo[con_motivo])
+    # el índice es la posición de la fila en la hoja completa (se conserva en bloques y meses)
+    rechazos.insert(0, "fila", rechazos.index.to_numpy() + PRIMERA_FILA_DATOS)
+    if cuentas_originales is not None:
+        rechazos.insert(4, "cuenta_original", cuentas_originales[con_motivo].to_numpy())
+    return rechazos
+
+
+def resumen_rechazos(rechazos: pd.DataFrame, col_monto: str) -> dict:
+    """Conteo por motivo y Debe/Haber (céntimos) de las filas descartadas."""
+    descartadas = rechazos.loc[rechazos["descartada"].astype(bool), col_monto]
+    monto = montos_a_centimos(montos_float(descartadas))
+    return {
+        "motivos": {m: int(n) for m, n in rechazos["motivo"].value_counts(sort=False).items()},
+        "descartadas": len(descartadas),
+        "debe": int(monto[monto > 0].sum()),
+        "haber": int(-monto[monto < 0].sum()),
+    }
+
+
+# Memoria de trabajo estimada por fila de entrada durante la generación (campos
+# intermedios + líneas armadas), como múltiplo de lo que ocupa la fila leída.
+FACTOR_MEMORIA_BLOQUE = 8
+MIN_FILAS_BLOQUE = 1_000
+
+
+def filas_por_memoria(diario_df: pd.DataFrame, memoria_max_mb: float) -> int:
+    """Tamaño de bloque para que la generación no supere *memoria_max_mb* (estimado con una muestra)."""
+    muestra = diario_df.head(10_000)
+    if muestra.empty:
+        return MIN_FILAS_BLOQUE
+    bytes_fila = muestra.memory_usage(deep=True, index=False).sum() / len(muestra)
+    return max(MIN_FILAS_BLOQUE, int(memoria_max_mb * 1024 ** 2 / (bytes_fila * FACTOR_MEMORIA_BLOQUE)))
+
+
+MOTORES_DIARIO = {
+    "vectorizado": _generar_diario_vectorizado,
+    "filas": _generar_diario_filas,
+}
+
+
+# ------------------------------------------------------------------
+# Escritura de los TXT PLE
+# ------------------------------------------------------------------
+
+LINEAS_POR_BLOQUE = 50_000          # líneas que se codifican y escriben juntas
+BUFFER_ESCRITURA  = 1 << 20         # 1 MiB de buffer del archivo
+
+
+def escribir_txt(ruta: Path, lineas: Iterable[str], lineas_por_bloque: int = LINEAS_POR_BLOQUE) -> int:
+    """Escribe *lineas* separadas por "\n" (sin salto final) por bloques; devuelve cuántas escribió.
+
+    Produce los mismos bytes que ``ruta.write_text("\n".join(lineas))`` sin armar
+    el texto completo en memoria.
+    """
+    escritas = 0
+    lineas = iter(lineas)
+    with open(ruta, "w", encoding="utf-8", buffering=BUFFER_ESCRITURA) as f:
+        while bloque := list(islice(lineas, lineas_por_bloque)):
+            if escritas:
+                f.write("\n")
+            f.write("\n".join(bloque))
+            escritas += len(bloque)
+    return escritas
+
+
+# ------------------------------------------------------------------
+# Procesamiento principal
+# ------------------------------------------------------------------
+
+def cargar_libro(archivo: Path, usar_cache: bool = True, incremental: bool = True,
+                 plan: dict | None = None, variante: str = "") -> dict | None:
+    """Etapa de lectura: hash, control incremental, hojas (caché o Excel) y columnas.
+
+    Devuelve la carga para ``generar_salidas``, el resumen con ``"sin_cambios"`` si
+    las salidas están al día, o None si el archivo se omite o no se puede leer.
+    *plan* es un Plan de Cuentas ya procesado (``cargar_plan``): con él no se lee la hoja 6.
+    *variante* (``variante_salida``) se compara con la del manifiesto en el control incremental.
+    """
+    logging.info(f"Procesando {archivo.name}")
+    mes = extraer_mes_archivo(archivo.stem)
+    if not mes:
+        logging.warning("No se pudo detectar el mes en el nombre de archivo – se omite.")
+        return None
+
+    ANIO = ANIO_TRABAJO
+    archivo_diario, archivo_plan = rutas_salida(ANIO, mes)
+
+    metricas: list[dict] = []
+    with medir_etapa(metricas, "hash_entrada", bytes=tamano_entrada(archivo)):
+        huella = hash_entrada(archivo)
+    huella_plan_compartido = plan["huella"] if plan is not None else None
+    if incremental and salidas_vigentes(huella, ANIO, [archivo_diario, archivo_plan], huella_plan_compartido,
+                                        variante):
+        logging.info(f"Sin cambios desde la última generación: se omite ({archivo_diario.name}, {archivo_plan.name}).")
+        logging.info("------------------------------------------------------------\n")
+        return {"archivo": archivo.name, "sin_cambios": True, "diario": archivo_diario.name,
+                "plan": archivo_plan.name, "metricas": metricas}
+
+    hojas = leer_hojas(archivo, huella, metricas, usar_cache, plan)
+    if hojas is None:
+        return None
+    hojas.update(archivo=archivo, huella=huella, anio=ANIO, mes=mes,
+                 archivo_diario=archivo_diario, archivo_plan=archivo_plan, metricas=metricas)
+    return hojas
+
+
+def leer_hojas(archivo: Path, huella: str, metricas: list[dict], usar_cache: bool = True,
+               plan: dict | None = None) -> dict | None:
+    """Lee el Diario (y el Plan, salvo *plan* compartido) desde la caché o la entrada.
+
+    Devuelve {"diario_df", "columnas", "pc_df", "col_cuenta_pc", "col_nombre_cuenta"}
+    o None si no se pudo leer o faltan columnas requeridas.
+    """
+    # con un Plan compartido (--plan) no hace falta leer la hoja 6 de este libro
+    hojas = (HOJA_DIARIO,) if plan is not None else (HOJA_DIARIO, HOJA_PLAN)
+    en_cache = {}
+    pc_df = col_cuenta_pc = col_nombre_cuenta = None
+    try:
+        if usar_cache:
+            with medir_etapa(metricas, "cache_lectura") as m:
+                en_cache = {hoja: cache_cargar(huella, hoja) for hoja in hojas}
+                m["aciertos"] = sum(v is not None for v in en_cache.values())
+        desde_cache = bool(en_cache) and all(v is not None for v in en_cache.values())
+        if desde_cache:
+            logging.info("Hojas leídas desde caché.")
+            diario_encab, diario_df = en_cache[HOJA_DIARIO]
+            if plan is None:
+                pc_encab, pc_df = en_cache[HOJA_PLAN]
+        else:
+            with medir_etapa(metricas, "apertura_entrada", bytes=tamano_entrada(archivo)):
+                fuente = abrir_entrada(archivo)
+            with medir_etapa(metricas, "encabezados"):
+                diario_encab = leer_encabezados(fuente, HOJA_DIARIO)
+                if plan is None:
+                    pc_encab = leer_encabezados(fuente, HOJA_PLAN)
+    except Exception as e:
+        logging.error(f"Error leyendo hojas: {e}")
+        return None
+
+    # ---------------- Resolución de columnas (solo encabezados) ----------------
+    with medir_etapa(metricas, "resolucion_columnas"):
+        if plan is None:
+            col_cuenta_pc, col_nombre_cuenta = resolver_columnas_plan(pc_encab, usar_cache)
+        columnas = resolver_columnas_diario(diario_encab, usar_cache)
+    if plan is None:
+        logging.info(f"Plan de Cuentas: usando columna de NOMBRE = '{col_nombre_cuenta}'")
+
+    required = ["cuenta", "fecha", "glosa", "monto", "journal_num", "journal_type"]
+    if any(columnas[k] is None for k in required):
+        logging.error("Faltan columnas requeridas en Diario – verifica nombres.")
+        logging.error("Columnas detectadas → cuenta=%s, fecha=%s, glosa=%s, monto=%s, jnum=%s, jtype=%s",
+                      *(columnas[k] for k in required))
+        logging.info("Encabezados disponibles en Diario: %s", [str(c) for c in diario_encab.columns])
+        return None
+
+    # ---------------- Lectura de solo las columnas usadas ----------------
+    if not desde_cache:
         try:
-            debe_line = float(parts[17]) if parts[17] else 0.0
-            haber_line = float(parts[18]) if parts[18] else 0.0
-        except ValueError:
-            continue
-        total_debe_estado[est] += debe_line
-        total_haber_estado[est] += haber_line
+            with medir_etapa(metricas, "lectura_diario") as m:
+                diario_df = leer_columnas(fuente, HOJA_DIARIO, diario_encab,
+                                          {columnas[k]: TIPOS_DIARIO.get(k) for k in columnas if columnas[k]},
+                                          fechas=[columnas["fecha"]] if columnas["fecha"] else [])
+                m["filas_salida"] = len(diario_df)
+            if plan is None:
+                with medir_etapa(metricas, "lectura_plan") as m:
+                    pc_df = leer_columnas(fuente, HOJA_PLAN, pc_encab,
+                                          {col_cuenta_pc: object, col_nombre_cuenta: None})
+                    m["filas_salida"] = len(pc_df)
+        except Exception as e:
+            logging.error(f"Error leyendo hojas: {e}")
+            return None
+        if usar_cache:
+            try:
+                with medir_etapa(metricas, "cache_escritura"):
+                    cache_guardar(huella, HOJA_DIARIO, diario_encab, diario_df)
+                    if plan is None:
+                        cache_guardar(huella, HOJA_PLAN, pc_encab, pc_df)
+            except OSError as e:
+                logging.warning(f"No se pudo guardar la caché: {e}")
+
+    return {
+        "diario_df": diario_df, "columnas": columnas,
+        "pc_df": pc_df, "col_cuenta_pc": col_cuenta_pc, "col_nombre_cuenta": col_nombre_cuenta,
+    }
+
+
+def generar_salidas(carga: dict, motor: str = MOTOR_DIARIO, usar_cache: bool = True,
+                    filas_por_bloque: int | None = None, memoria_max_mb: float | None = None,
+                    orden_plan: str = ORDEN_PLAN, plan: dict | None = None,
+                    subir_a_padre: bool = False, detalle_avisos: bool = False) -> dict:
+    """Etapa de transformación: Plan, líneas 5.1 y resumen por estado de una carga.
+
+    Devuelve el resumen con ``"escrituras"``: [(etapa, ruta, líneas)] y ``"origen"``
+    pendientes de ``escribir_salidas``. Con *filas_por_bloque* (o *memoria_max_mb*, que lo estima)
+    el Diario se genera y escribe aquí mismo por bloques, sin armar todas las líneas.
+
+    *plan* es el Plan ya procesado: el compartido (--plan) si la carga no trae hoja 6,
+    o el de la propia entrada ya calculado (modo anual). Con *subir_a_padre*, las líneas
+    con subcuentas que no están en el Plan se imputan a su cuenta padre más cercana.
+    Los avisos del Diario se emiten una vez, agregados (todas las filas con *detalle_avisos*).
+    """
+    metricas = carga["metricas"]
+    ANIO, mes = carga["anio"], carga["mes"]
+    archivo_diario, archivo_plan = carga["archivo_diario"], carga["archivo_plan"]
+    diario_df, columnas = carga["diario_df"], carga["columnas"]
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    # ---------------- Plan de cuentas ----------------
+    plan_compartido = carga["pc_df"] is None
+    if plan is None:
+        with medir_etapa(metricas, "plan", filas_entrada=len(carga["pc_df"])) as m:
+            plan = obtener_plan(carga["pc_df"], carga["col_cuenta_pc"], carga["col_nombre_cuenta"],
+                                orden_plan, usar_cache)
+            m["filas_salida"] = len(plan["sufijos"])
+
+    dia_final = ultimo_dia_mes(ANIO, int(mes))
+    periodo_plan = f"{ANIO}{mes}{dia_final:02d}"   # 20200131 para plan de cuentas
+
+    cuentas_validas = plan["cuentas_validas"]
+    cuentas_originales = None
+    if subir_a_padre:
+        cuentas_originales = diario_df[columnas["cuenta"]]
+        with medir_etapa(metricas, "cuentas_padre", filas_entrada=len(diario_df)) as m:
+            diario_df = subir_cuentas_a_padre(diario_df, columnas["cuenta"], plan)
+    if filas_por_bloque is None and memoria_max_mb:
+        filas_por_bloque = filas_por_memoria(diario_df, memoria_max_mb)
+    por_bloques = bool(filas_por_bloque) and motor == "vectorizado" and len(diario_df) > filas_por_bloque
+
+    escrituras = []
+    if por_bloques:
+        # generación y escritura juntas: solo un bloque de líneas en memoria a la vez
+        logging.info(f"Libro Diario por bloques de {filas_por_bloque} filas.")
+        resumen = {"lineas": 0, "total_debe": 0, "total_haber": 0, "estados": {}}
+        with medir_etapa(metricas, "diario_bloques", filas_entrada=len(diario_df)) as m:
+            escribir_txt(archivo_diario, lineas_diario_por_bloques(
+                diario_df, columnas, cuentas_validas, ANIO, mes, filas_por_bloque, resumen))
+            m["filas_salida"] = resumen["lineas"]
+            m["bytes"] = archivo_diario.stat().st_size
+    else:
+        generar_diario = MOTORES_DIARIO[motor]
+        diario_lines, resumen = generar_diario(diario_df, columnas, cuentas_validas, ANIO, mes, metricas=metricas)
+        escrituras.append(("escritura_diario", archivo_diario, diario_lines))
 
-    logging.info(f"Conteo estados Libro Diario: {estado_counts}")
-    for est in sorted(total_debe_estado.keys()):
-        logging.info(f"Totales por estado {est}: Debe={total_debe_estado[est]:.2f} Haber={total_haber_estado[est]:.2f}")
-    logging.info(f"Totales Libro Diario: Debe={total_debe_sum:.2f} Haber={total_haber_sum:.2f}")
+    # ------------------ Resumen por estado y totales (simula control de SUNAT) ----------------
+    estados = resumen["estados"]
+    logging.info(f"Conteo estados Libro Diario: { {est: t['lineas'] for est, t in estados.items()} }")
+    for est, tot in estados.items():
+        logging.info(f"Totales por estado {est}: Debe={formato_centimos(tot['debe'])} "
+                     f"Haber={formato_centimos(tot['haber'])}")
+    logging.info(f"Totales Libro Diario: Debe={formato_centimos(resumen['total_debe'])} "
+                 f"Haber={formato_centimos(resumen['total_haber'])}")
+    resumen["avisos"] = emitir_avisos(resumen.get("avisos", {}), detalle_avisos)
+
+    # ------------------ Filas descartadas o corregidas (archivo aparte) ----------------
+    with medir_etapa(metricas, "rechazos", filas_entrada=len(diario_df)) as m:
+        rechazos = clasificar_rechazos(diario_df, columnas, cuentas_validas, cuentas_originales)
+        m["filas_salida"] = len(rechazos)
+    archivo_rechazos = OUTPUT_DIR / f"RECHAZOS_{RUC}{ANIO}{mes}00.csv"
+    escrituras.append(("escritura_rechazos", archivo_rechazos, rechazos))
+    if not rechazos.empty:
+        resumen["rechazos"] = resumen_rechazos(rechazos, columnas["monto"])
+        rec = resumen["rechazos"]
+        logging.info(f"Filas con observaciones: {rec['motivos']} → {archivo_rechazos.name}")
+        logging.info(f"Descartadas: {rec['descartadas']} filas, Debe={formato_centimos(rec['debe'])} "
+                     f"Haber={formato_centimos(rec['haber'])}")
 
-    archivo_diario = OUTPUT_DIR / f"LE{RUC}{ANIO}{mes}00050100001111.txt"
-    archivo_diario.write_text("\n".join(diario_lines), encoding="utf-8")
-    logging.info(f"Diario PLE → {archivo_diario.name}  (líneas: {len(diario_lines)})")
     # ----- Plan de Cuentas (usa periodo con día final) -----
-    plan_lines = []
-    for _, row in pc_df.iterrows():
-        cuenta = row["codigo_cuenta"]
-        nombre = str(row.get(col_nombre_cuenta, "")).strip()
-        line = [
-            periodo_plan, cuenta, nombre, "01", "", "", "", "1", ""
-        ]
-        plan_lines.append("|".join(line) + "|")
+    lineas_plan = [f"{periodo_plan}|{s}" for s in plan["sufijos"]]
+    escrituras.append(("escritura_plan", archivo_plan, lineas_plan))
+    logging.info(f"Diario PLE → {archivo_diario.name}  (líneas: {resumen['lineas']})")
+    logging.info(f"Plan de Ctas PLE → {archivo_plan.name}  (líneas: {len(lineas_plan)})")
+    logging.info("------------------------------------------------------------\n")
+
+    resumen.update(archivo=carga["archivo"].name, diario=archivo_diario.name, plan=archivo_plan.name,
+                   lineas_plan=len(lineas_plan), metricas=metricas, escrituras=escrituras,
+                   origen=(carga["archivo"], carga["huella"], ANIO, plan["huella"] if plan_compartido else None,
+                           variante_salida(orden_plan, subir_a_padre)))
+    return resumen
+
+
+def escribir_salidas(resumen: dict) -> dict:
+    """Etapa de escritura: vuelca las ``"escrituras"`` pendientes del resumen a disco y
+    arma las entradas del manifiesto de las salidas ya escritas."""
+    for etapa, ruta, lineas in resumen.pop("escrituras"):
+        if isinstance(lineas, pd.DataFrame):
+            # tabla de filas rechazadas: un solo to_csv; sin filas no queda archivo
+            if lineas.empty:
+                ruta.unlink(missing_ok=True)
+                continue
+            with medir_etapa(resumen["metricas"], etapa, filas_entrada=len(lineas)) as m:
+                lineas.to_csv(ruta, index=False, encoding="utf-8")
+                m["filas_salida"] = len(lineas)
+                m["bytes"] = ruta.stat().st_size
+            continue
+        with medir_etapa(resumen["metricas"], etapa, filas_entrada=len(lineas)) as m:
+            m["filas_salida"] = escribir_txt(ruta, lineas)
+            m["bytes"] = ruta.stat().st_size
+    archivo, huella, anio, huella_plan, variante = resumen.pop("origen")
+    resumen["manifiesto"] = {nombre: entrada_manifiesto(archivo, huella, anio, OUTPUT_DIR / nombre,
+                                                        huella_plan, variante)
+                             for nombre in (resumen["diario"], resumen["plan"])}
+    return resumen
+
+
+def procesar_excel(archivo: Path, motor: str = MOTOR_DIARIO, usar_cache: bool = True,
+                   incremental: bool = True, filas_por_bloque: int | None = None,
+                   memoria_max_mb: float | None = None, orden_plan: str = ORDEN_PLAN,
+                   plan: dict | None = None, subir_a_padre: bool = False,
+                   detalle_avisos: bool = False) -> dict | None:
+    """Genera los TXT 5.1 y 5.3 de *archivo* y devuelve el resumen (None si se omitió).
+
+    El resumen incluye en ``"metricas"`` el tiempo y los contadores de cada etapa y en
+    ``"manifiesto"`` las entradas a registrar para el modo incremental. Si *incremental*
+    y el manifiesto indica que las salidas están al día, no se procesa nada.
+
+    Ejecuta en secuencia ``cargar_libro``, ``generar_salidas`` y ``escribir_salidas``.
+    """
+    carga = cargar_libro(archivo, usar_cache, incremental, plan, variante_salida(orden_plan, subir_a_padre))
+    if carga is None or carga.get("sin_cambios"):
+        return carga
+    resumen = generar_salidas(carga, motor, usar_cache, filas_por_bloque, memoria_max_mb, orden_plan, plan,
+                              subir_a_padre, detalle_avisos)
+    return escribir_salidas(resumen)
+
+
+def meses_por_fecha(fechas: pd.Series, anio: int) -> pd.Series:
+    """Mes ("01"‑"12") en que va cada línea de un Diario anual, según su fecha de operación.
+
+    Las líneas de años anteriores van a enero (donde quedan en estado 8, como en un
+    libro mensual); las sin fecha o de años posteriores, a diciembre.
+    """
+    fechas = _parsear_fechas(fechas)
+    anio_op = fechas.dt.year.to_numpy(dtype=float)
+    mes_op = fechas.dt.month.fillna(12).to_numpy(dtype=np.int64)
+    mes = np.where(anio_op == anio, mes_op, np.where(anio_op < anio, 1, 12))
+    return pd.Series(_dos_digitos()[mes], index=fechas.index, dtype=object)
+
+
+def procesar_anual(archivo: Path, motor: str = MOTOR_DIARIO, usar_cache: bool = True,
+                   incremental: bool = True, filas_por_bloque: int | None = None,
+                   memoria_max_mb: float | None = None, orden_plan: str = ORDEN_PLAN,
+                   plan: dict | None = None, subir_a_padre: bool = False,
+                   detalle_avisos: bool = False) -> dict | None:
+    """Genera los 12 pares de TXT 5.1 / 5.3 del año desde una sola entrada con el Diario anual.
+
+    La entrada se lee una vez, el Diario se parte por mes de la fecha de operación
+    (``meses_por_fecha``) y el Plan se procesa una sola vez para los doce meses.
+    Devuelve un resumen con ``"meses"`` ({mes: resumen}) o None si falló la lectura.
+    """
+    logging.info(f"Procesando {archivo.name} (modo anual {ANIO_TRABAJO})")
+    ANIO = ANIO_TRABAJO
+    meses = sorted(set(MESES.values()))
+    salidas = [ruta for mes in meses for ruta in rutas_salida(ANIO, mes)]
+
+    metricas: list[dict] = []
+    with medir_etapa(metricas, "hash_entrada", bytes=tamano_entrada(archivo)):
+        huella = hash_entrada(archivo)
+    if incremental and salidas_vigentes(huella, ANIO, salidas, plan["huella"] if plan is not None else None,
+                                        variante_salida(orden_plan, subir_a_padre)):
+        logging.info(f"Sin cambios desde la última generación: se omiten los {len(meses)} meses.")
+        logging.info("------------------------------------------------------------\n")
+        return {"archivo": archivo.name, "sin_cambios": True, "metricas": metricas}
+
+    carga = leer_hojas(archivo, huella, metricas, usar_cache, plan)
+    if carga is None:
+        return None
+    if plan is None:
+        with medir_etapa(metricas, "plan", filas_entrada=len(carga["pc_df"])) as m:
+            plan = obtener_plan(carga["pc_df"], carga["col_cuenta_pc"], carga["col_nombre_cuenta"],
+                                orden_plan, usar_cache)
+            m["filas_salida"] = len(plan["sufijos"])
 
-    archivo_plan = OUTPUT_DIR / f"LE{RUC}{ANIO}{mes}00050300001111.txt"
-    archivo_plan.write_text("\n".join(plan_lines), encoding="utf-8")
-    logging.info(f"Plan de Ctas PLE → {archivo_plan.name}  (líneas: {len(plan_lines)})")
+    diario_df = carga["diario_df"]
+    with medir_etapa(metricas, "particion_meses", filas_entrada=len(diario_df)):
+        fechas = _parsear_fechas(diario_df[carga["columnas"]["fecha"]])
+        grupos = dict(iter(diario_df.groupby(meses_por_fecha(fechas, ANIO), sort=True)))
+    anteriores = int((fechas.dt.year < ANIO).sum())
+    restantes = int((fechas.dt.year != ANIO).sum()) - anteriores
+    if anteriores:
+        logging.info(f"{anteriores} líneas de años anteriores asignadas a 01/{ANIO}.")
+    if restantes:
+        logging.info(f"{restantes} líneas sin fecha o de años posteriores asignadas a 12/{ANIO}.")
     logging.info("------------------------------------------------------------\n")
 
+    resumenes = {}
+    for mes in meses:
+        archivo_diario, archivo_plan = rutas_salida(ANIO, mes)
+        logging.info(f"Periodo {mes}/{ANIO} de {archivo.name}")
+        carga_mes = dict(carga, archivo=archivo, huella=huella, anio=ANIO, mes=mes,
+                         diario_df=grupos.get(mes, diario_df.iloc[:0]),
+                         archivo_diario=archivo_diario, archivo_plan=archivo_plan, metricas=[])
+        resumen = generar_salidas(carga_mes, motor, usar_cache, filas_por_bloque, memoria_max_mb,
+                                  orden_plan, plan, subir_a_padre, detalle_avisos)
+        resumenes[mes] = escribir_salidas(resumen)
+        for registro in resumen["metricas"]:
+            metricas.append(dict(registro, mes=mes))
+
+    return {
+        "archivo": archivo.name, "meses": resumenes, "metricas": metricas,
+        "lineas": sum(r["lineas"] for r in resumenes.values()),
+        "manifiesto": {nombre: entrada for r in resumenes.values() for nombre, entrada in r["manifiesto"].items()},
+    }
+
 # ------------------------------------------------------------------
 # Búsqueda de archivos y ejecución
 # ------------------------------------------------------------------
 
-def main():
-    archivos = list(INPUT_DIR.glob("DIARIO,*2020_2.xlsx"))
-    if not archivos:
-        logging.warning("No se encontraron archivos con patrón 'DIARIO,*2020_2.xlsx'")
-    for archivo in archivos:
-        procesar_excel(archivo)
+def _ejecutar_capturando(funcion, *args, **kwargs) -> tuple[object, list[tuple[int, str]]]:
+    """Ejecuta *funcion* (en un proceso hijo) y devuelve (resultado, registros de log)."""
+    raiz = logging.getLogger()
+    buffer = logging.handlers.BufferingHandler(capacity=sys.maxsize)
+    anteriores, nivel_anterior = raiz.handlers[:], raiz.level
+    # se captura desde INFO aunque el hijo no haya configurado logging; filtra el padre al reemitir
+    raiz.handlers = [buffer]
+    raiz.setLevel(logging.INFO)
+    try:
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception:
+            logging.exception(f"Error inesperado procesando {args[0].name}")
+            resultado = None
+    finally:
+        raiz.handlers = anteriores
+        raiz.setLevel(nivel_anterior)
+    formato = logging.Formatter("%(message)s")
+    return resultado, [(r.levelno, formato.format(r)) for r in buffer.buffer]
+
+
+def _emitir_registros(registros: list[tuple[int, str]]) -> None:
+    for nivel, mensaje in registros:
+        logging.log(nivel, mensaje)
+
+
+# Libros leídos por adelantado y salidas pendientes de escribir en el pipeline
+LIBROS_EN_LECTURA = 2
+SALIDAS_EN_ESCRITURA = 2
+
+
+def _escritor(cola: queue.Queue, terminados: dict) -> None:
+    """Hilo escritor: toma (índice, resumen) de *cola* hasta recibir None."""
+    while (trabajo := cola.get()) is not None:
+        indice, resumen = trabajo
+        try:
+            terminados[indice] = escribir_salidas(resumen)
+        except Exception as e:
+            terminados[indice] = e
+
+
+def procesar_en_pipeline(archivos: list[Path], motor: str = MOTOR_DIARIO, usar_cache: bool = True,
+                         incremental: bool = True, filas_por_bloque: int | None = None,
+                         memoria_max_mb: float | None = None, orden_plan: str = ORDEN_PLAN,
+                         plan: dict | None = None, subir_a_padre: bool = False,
+                         detalle_avisos: bool = False) -> list[dict | None]:
+    """Procesa *archivos* solapando las etapas: mientras se transforma el libro N, un
+    proceso lector decodifica el N+1 y un hilo escritor vuelca las salidas del N-1.
+
+    Las colas están acotadas (LIBROS_EN_LECTURA, SALIDAS_EN_ESCRITURA). Los logs de
+    cada archivo salen juntos y en orden; devuelve los resúmenes en el orden de entrada.
+    """
+    resumenes: list[dict | None] = [None] * len(archivos)
+    variante = variante_salida(orden_plan, subir_a_padre)
+    terminados: dict[int, dict | Exception] = {}
+    cola_escritura: queue.Queue = queue.Queue(maxsize=SALIDAS_EN_ESCRITURA)
+    escritor = threading.Thread(target=_escritor, args=(cola_escritura, terminados), daemon=True)
+    escritor.start()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as lector:
+            pendientes = iter(enumerate(archivos))
+            en_lectura: deque = deque()
+            for indice, archivo in islice(pendientes, LIBROS_EN_LECTURA):
+                en_lectura.append((indice, archivo, lector.submit(
+                    _ejecutar_capturando, cargar_libro, archivo, usar_cache, incremental, plan, variante)))
+            while en_lectura:
+                indice, archivo, futuro = en_lectura.popleft()
+                for siguiente, otro in islice(pendientes, 1):
+                    en_lectura.append((siguiente, otro, lector.submit(
+                        _ejecutar_capturando, cargar_libro, otro, usar_cache, incremental, plan, variante)))
+                try:
+                    carga, registros = futuro.result()
+                except Exception as e:
+                    carga, registros = None, [(logging.ERROR, f"Error en proceso lector con {archivo.name}: {e}")]
+                _emitir_registros(registros)
+                if carga is None or carga.get("sin_cambios"):
+                    resumenes[indice] = carga
+                    continue
+                try:
+                    resumen = generar_salidas(carga, motor, usar_cache, filas_por_bloque,
+                                              memoria_max_mb, orden_plan, plan, subir_a_padre,
+                                              detalle_avisos)
+                except Exception:
+                    logging.exception(f"Error inesperado procesando {archivo.name}")
+                    continue
+                cola_escritura.put((indice, resumen))
+    finally:
+        cola_escritura.put(None)
+        escritor.join()
+
+    for indice, resultado in sorted(terminados.items()):
+        if isinstance(resultado, Exception):
+            logging.error(f"Error escribiendo las salidas de {archivos[indice].name}: {resultado}")
+        else:
+            resumenes[indice] = resultado
+    return resumenes
+
+
+def procesar_archivos(archivos: list[Path], jobs: int = 1, pipeline: bool = True, anual: bool = False,
+                      **opciones) -> list[tuple[Path, dict | None]]:
+    """Procesa *archivos* y devuelve [(archivo, resumen)] en orden.
+
+    Con jobs > 1 cada archivo va a un proceso; con un solo job y varios archivos se
+    usa ``procesar_en_pipeline`` (salvo pipeline=False: estrictamente secuencial).
+    Con *anual* cada archivo es un Diario de todo el año (``procesar_anual``).
+    *opciones* se pasan tal cual a ``procesar_excel``. Al final se actualiza el
+    manifiesto con las salidas generadas.
+    """
+    procesar = procesar_anual if anual else procesar_excel
+    resultados: list[tuple[Path, dict | None]] = []
+    if jobs <= 1 and pipeline and not anual and len(archivos) > 1:
+        resultados = list(zip(archivos, procesar_en_pipeline(archivos, **opciones)))
+    elif jobs <= 1:
+        for archivo in archivos:
+            try:
+                resumen = procesar(archivo, **opciones)
+            except Exception:
+                logging.exception(f"Error inesperado procesando {archivo.name}")
+                resumen = None
+            resultados.append((archivo, resumen))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            futuros = [pool.submit(_ejecutar_capturando, procesar, archivo, **opciones)
+                       for archivo in archivos]
+            # los logs de cada archivo se emiten juntos y en el orden de entrada
+            for archivo, futuro in zip(archivos, futuros):
+                try:
+                    resumen, registros = futuro.result()
+                except Exception as e:
+                    resumen, registros = None, [(logging.ERROR, f"Error en proceso hijo con {archivo.name}: {e}")]
+                _emitir_registros(registros)
+                resultados.append((archivo, resumen))
+    actualizar_manifiesto(resultados)
+    return resultados
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,237 @@
+import math
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import scriptPLE as ple
+
+
+def esperado(valores):
+    return [ple.normalizar_codigo(v) for v in valores]
+
+
+@pytest.mark.parametrize("valores, dtype", [
+    ([101, 4011, 101, 0], "int64"),
+    ([101.0, 4011.0, 1.0, 0.0], "float64"),
+    ([101.5, 4011.25, 1.0], "float64"),
+    ([101.0, math.nan, 4011.0, None], "float64"),
+    ([None, math.nan, "101", None], object),
+    (["  101 ", "40 11", "abc", "ABC", "101"], object),
+    ([101, 101.0, "101", " 101", 4011.5, None, "x 1", math.nan], object),
+    ([1, True, 0, False, 1.0, "1", "true"], object),
+    ([True, 1, False, 0], object),
+    ([True, False, True], bool),
+    ([np.int64(7), np.float64(7.0), np.True_, "7"], object),
+])
+def test_normalize_accounts_equivale_a_normalizar_codigo(valores, dtype):
+    serie = pd.Series(valores, dtype=dtype, index=range(10, 10 + len(valores)))
+    resultado = ple.normalize_accounts(serie)
+    assert resultado.tolist() == esperado(serie.tolist())
+    assert resultado.index.equals(serie.index)
+    assert resultado.dtype == object
+
+
+def test_normalize_accounts_columna_vacia():
+    assert ple.normalize_accounts(pd.Series([], dtype=object)).tolist() == []
+
+
+def test_leer_columnas_csv_quita_decimal_de_codigos(tmp_path):
+    ruta = tmp_path / "diario.csv"
+    ruta.write_text("Cuenta,Monto\n822053.0,1.5\n,2\n0101,3\nA1.0,4\n10.50,5\n", encoding="utf-8")
+    fuente = {ple.HOJA_DIARIO: ruta}
+    encabezados = ple.leer_encabezados(fuente, ple.HOJA_DIARIO)
+    df = ple.leer_columnas(fuente, ple.HOJA_DIARIO, encabezados, {"Cuenta": object, "Monto": None})
+    assert ple.normalize_accounts(df["Cuenta"]).tolist() == ["822053", "", "0101", "A1.0", "10.50"]
+    assert df["Monto"].tolist() == [1.5, 2.0, 3.0, 4.0, 5.0]
+
+
+COLUMNAS = {
+    "cuenta": "Cuenta Peruana", "fecha": "Transaction Date", "glosa": "Description.1",
+    "monto": "Base Amount", "journal_num": "Journal Number", "journal_type": "Journal Type",
+    "currency": "Transaction Currency Code", "ref_doc": "Transaction Reference",
+}
+CUENTAS = {"101", "4011", "70121", "A1"}
+
+
+def diario_mixto(filas=97):
+    """Diario con tipos mezclados en cada columna, como llegan de hojas editadas a mano.
+
+    Las celdas vacías de texto van como NaN, como las entregan los lectores: con None,
+    iterrows (pandas 3) lo convierte en NaN solo en las filas que son todas texto.
+    """
+    cuentas = [101, "4011", 70121.0, " a1 ", None, "999", 101.0, "4011 "]
+    fechas = ["2020-02-15", pd.Timestamp(2020, 2, 3), "2020-01-20", "2019-11-30 10:00", "no es fecha",
+              None, pd.Timestamp(2020, 3, 5), "2020/02/29", pd.Timestamp(2018, 12, 31)]
+    montos = [1500.255, "-20.10", math.nan, "abc", -0.004, 12, 1e9 + 0.125, "3,5", -7.5]
+    numeros = [77.0, 12, "305", math.nan, "A-9", 100.0]
+    tipos = ["VTA", " cmp", math.nan, "dia", 5]
+    monedas = ["PEN", "usd ", "Soles", "EUR", math.nan, 978, "", "pen"]
+    refs = ["F001-5068", "b123/45", "APERTURA 2020", "apertura x", "T0010000", "F0015068",
+            "REF LIBRE", None, 12345, "F001-"]
+    return pd.DataFrame({
+        COLUMNAS["cuenta"]: [cuentas[i % len(cuentas)] for i in range(filas)],
+        COLUMNAS["fecha"]: [fechas[i % len(fechas)] for i in range(filas)],
+        COLUMNAS["glosa"]: [f" glosa {i} " if i % 7 else math.nan for i in range(filas)],
+        COLUMNAS["monto"]: [montos[i % len(montos)] for i in range(filas)],
+        COLUMNAS["journal_num"]: [numeros[i % len(numeros)] for i in range(filas)],
+        COLUMNAS["journal_type"]: [tipos[i % len(tipos)] for i in range(filas)],
+        COLUMNAS["currency"]: [monedas[i % len(monedas)] for i in range(filas)],
+        COLUMNAS["ref_doc"]: [refs[i % len(refs)] for i in range(filas)],
+    }, dtype=object)
+
+
+def generar(motor, diario_df, mes="02"):
+    return ple.MOTORES_DIARIO[motor](diario_df, COLUMNAS, CUENTAS, 2020, mes)
+
+
+@pytest.mark.parametrize("mes", ["01", "02", "12"])
+def test_motor_vectorizado_igual_al_de_filas(mes):
+    diario_df = diario_mixto()
+    lineas, resumen = generar("vectorizado", diario_df, mes)
+    lineas_ref, resumen_ref = generar("filas", diario_df, mes)
+    assert lineas == lineas_ref
+    assert resumen == resumen_ref
+    assert len(lineas) > 50
+    assert {linea.split("|")[-2] for linea in lineas} == {"1", "8"}
+
+
+@pytest.mark.parametrize("filas_por_bloque", [1, 10, 13, 500])
+def test_diario_por_bloques_igual_a_una_pasada(filas_por_bloque):
+    diario_df = diario_mixto()
+    lineas, resumen = generar("vectorizado", diario_df)
+    resumen_bloques = {"lineas": 0, "total_debe": 0, "total_haber": 0, "estados": {}}
+    lineas_bloques = list(ple.lineas_diario_por_bloques(diario_df, COLUMNAS, CUENTAS, 2020, "02",
+                                                        filas_por_bloque, resumen_bloques))
+    assert lineas_bloques == lineas
+    assert resumen_bloques == resumen
+    # el CUO sigue numerando en los bloques siguientes (no vuelve a 001)
+    assert len({linea.split("|")[1] for linea in lineas_bloques}) == len(lineas_bloques)
+
+
+def test_fechas_con_zonas_horarias_mezcladas():
+    serie = pd.Series(["2020-02-03 10:00:00+05:00", "2020-02-04", "2019-12-31 23:00:00-05:00",
+                       "basura", math.nan], index=range(3, 8))
+    fechas = ple._parsear_fechas(serie)
+    assert fechas.index.equals(serie.index)
+    assert fechas.tolist()[:3] == [pd.Timestamp(2020, 2, 3, 10), pd.Timestamp(2020, 2, 4),
+                                   pd.Timestamp(2019, 12, 31, 23)]
+    assert fechas.iloc[3:].isna().all()
+
+    diario_df = diario_mixto()
+    diario_df.loc[::4, COLUMNAS["fecha"]] = serie.iloc[0]
+    diario_df.loc[1::4, COLUMNAS["fecha"]] = serie.iloc[2]
+    lineas, resumen = generar("vectorizado", diario_df)
+    assert (lineas, resumen) == generar("filas", diario_df)
+    assert ple.clasificar_rechazos(diario_df, COLUMNAS, CUENTAS)["motivo"].ne("fecha_invalida").any()
+    assert ple.meses_por_fecha(diario_df[COLUMNAS["fecha"]], 2020).iloc[1] == "01"
+
+
+def test_csv_con_fechas_dia_primero(tmp_path):
+    ruta = tmp_path / "diario.csv"
+    ruta.write_text(
+        "Cuenta Peruana,Transaction Date,Description,Base Amount,Journal Number,Journal Type,"
+        "Transaction Currency Code,Transaction Reference\n"
+        "101,05/01/2020,a,10,1,VTA,PEN,F001-1\n"
+        "101,13/01/2020,b,20,2,VTA,PEN,F001-2\n"
+        "101,03/02/2020,c,30,3,VTA,PEN,F001-3\n"
+        "101,2020-01-20,d,40,4,VTA,PEN,F001-4\n"
+        "101,sin fecha,e,50,5,VTA,PEN,F001-5\n",
+        encoding="utf-8")
+    fuente = {ple.HOJA_DIARIO: ruta}
+    encabezados = ple.leer_encabezados(fuente, ple.HOJA_DIARIO)
+    columnas = dict(COLUMNAS, glosa="Description")
+    diario_df = ple.leer_columnas(fuente, ple.HOJA_DIARIO, encabezados, {c: None for c in columnas.values()},
+                                  fechas=[columnas["fecha"]])
+    assert diario_df[columnas["fecha"]].iloc[4] == "sin fecha"
+
+    lineas, _ = ple.MOTORES_DIARIO["vectorizado"](diario_df, columnas, CUENTAS, 2020, "02")
+    campos = [linea.split("|") for linea in lineas]
+    # (periodo, fecha, estado) de cada línea
+    assert [(c[0], c[14], c[20]) for c in campos] == [
+        ("20200100", "05/01/2020", "8"),
+        ("20200100", "13/01/2020", "8"),
+        ("20200200", "03/02/2020", "1"),
+        ("20200100", "20/01/2020", "8"),
+        ("20200200", "29/02/2020", "1"),
+    ]
+    assert ple.MOTORES_DIARIO["filas"](diario_df, columnas, CUENTAS, 2020, "02")[0] == lineas
+
+
+@pytest.mark.parametrize("motor", ["pyarrow", "fastparquet"])
+def test_entrada_parquet_ida_y_vuelta(tmp_path, motor):
+    pytest.importorskip(motor)
+    # Parquet no guarda columnas de tipos mezclados: texto, salvo monto y número de asiento
+    diario_df = diario_mixto().astype(str).replace("nan", None)
+    diario_df[COLUMNAS["monto"]] = pd.to_numeric(diario_df[COLUMNAS["monto"]], errors="coerce")
+    diario_df[COLUMNAS["journal_num"]] = pd.to_numeric(diario_df[COLUMNAS["journal_num"]], errors="coerce")
+    diario_df["Extra"] = range(len(diario_df))
+    ruta = tmp_path / "diario.parquet"
+    diario_df.to_parquet(ruta, engine=motor, index=False)
+
+    fuente = {ple.HOJA_DIARIO: ruta}
+    encabezados = ple.leer_encabezados(fuente, ple.HOJA_DIARIO)
+    assert list(encabezados.columns) == list(diario_df.columns)
+    columnas = ple.resolver_columnas_diario(encabezados, usar_cache=False)
+    assert columnas == COLUMNAS
+    leido = ple.leer_columnas(fuente, ple.HOJA_DIARIO, encabezados,
+                              {columnas[k]: ple.TIPOS_DIARIO.get(k) for k in columnas})
+    assert list(leido.columns) == list(COLUMNAS.values())
+    lineas, resumen = generar("vectorizado", leido)
+    assert (lineas, resumen) == generar("vectorizado", diario_df)
+    assert len(lineas) > 40
+
+
+@pytest.mark.parametrize("dtype", [float, object])
+def test_montos_fuera_de_rango(dtype):
+    montos = [1e17, -1e17, -1e12, 999_999_999_999.99, -999_999_999_999.99, 12.5]
+    diario_df = diario_mixto(len(montos))
+    diario_df[COLUMNAS["cuenta"]] = "101"
+    diario_df[COLUMNAS["monto"]] = pd.Series(montos, dtype=dtype)
+    lineas, resumen = generar("vectorizado", diario_df)
+    assert (lineas, resumen) == generar("filas", diario_df)
+    assert [tuple(linea.split("|")[17:19]) for linea in lineas] == [
+        ("0.00", "0.00"), ("0.00", "0.00"), ("0.00", "0.00"),
+        ("999999999999.99", "0.00"), ("0.00", "999999999999.99"), ("12.50", "0.00"),
+    ]
+    rechazos = ple.clasificar_rechazos(diario_df, COLUMNAS, CUENTAS)
+    assert rechazos.loc[rechazos["motivo"] == "monto_invalido", "fila"].tolist() == [2, 3, 4]
+
+
+def test_cache_no_deserializa_pickles_ajenos(tmp_path, monkeypatch):
+    monkeypatch.setattr(ple, "CACHE_DIR", tmp_path)
+    encabezados, df = pd.DataFrame(columns=["a"]), pd.DataFrame({"a": [1, "x", None]})
+    ple.cache_guardar("h", ple.HOJA_DIARIO, encabezados, df)
+    cargado = ple.cache_cargar("h", ple.HOJA_DIARIO)
+    assert cargado is not None and cargado[1].equals(df)
+    assert (tmp_path / "clave").stat().st_mode & 0o077 == 0
+
+    class Trampa:
+        def __reduce__(self):
+            return (pytest.fail, ("se ejecutó un pickle sin firma",))
+
+    ruta = ple._ruta_cache("h", ple.HOJA_DIARIO)
+    ruta.write_bytes(bytes(32) + pickle.dumps(Trampa()))
+    assert ple.cache_cargar("h", ple.HOJA_DIARIO) is None
+
+
+def test_rechazos_registran_cuentas_subidas_a_padre():
+    diario_df = diario_mixto(6)
+    diario_df[COLUMNAS["cuenta"]] = ["4011", 401199.0, "70121 05", "999", None, "A1X"]
+    diario_df[COLUMNAS["monto"]] = 10.0
+    diario_df[COLUMNAS["fecha"]] = "2020-02-10"
+    plan = {"cuentas_validas": frozenset(CUENTAS)}
+    subido = ple.subir_cuentas_a_padre(diario_df, COLUMNAS["cuenta"], plan)
+    rechazos = ple.clasificar_rechazos(subido, COLUMNAS, CUENTAS, diario_df[COLUMNAS["cuenta"]])
+    assert list(rechazos.columns[:5]) == ["fila", "motivo", "descartada", COLUMNAS["cuenta"], "cuenta_original"]
+    assert rechazos[["fila", "motivo", "descartada", COLUMNAS["cuenta"]]].values.tolist() == [
+        [3, "cuenta_subida", False, "4011"],
+        [4, "cuenta_subida", False, "70121"],
+        [5, "cuenta_desconocida", True, "999"],
+        [6, "cuenta_vacia", True, None],
+        [7, "cuenta_subida", False, "A1"],
+    ]
+    assert rechazos["cuenta_original"].tolist() == [401199.0, "70121 05", "999", None, "A1X"]
+    assert ple.resumen_rechazos(rechazos, COLUMNAS["monto"])["descartadas"] == 2
+    assert "cuenta_original" not in ple.clasificar_rechazos(subido, COLUMNAS, CUENTAS).columns